@@ -0,0 +1,316 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import timeit
+import numpy as np
+from field import Field
+from bitfield import BitField
+from jitfield import JitField, numba, warm_up
+from tetrimino import Tetrimino, MINO_TABLE, ROTATIONS
+from search import get_candidate_list
+
+# モデル生成の起動時間を計測するプロセスはリポジトリのディレクトリで実行する (どこから実行しても同じ結果になるように)
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_board(field, rng, height, density):
+    """ ランダムな盤面を作る (下から height 行をおおよそ density の割合で埋める)
+
+    :param field: 空の盤面 (Field / BitField)
+    :param rng: 乱数生成器(random.Random)
+    :param height: 埋める行数
+    :param density: 各マスを埋める確率
+    :return: 引数の盤面
+    """
+    blocks = [(x, y, rng.randrange(7)) for y in range(20 - height, 20) for x in range(1, 11)
+              if rng.random() < density]
+    field.set_blocks(blocks)
+    return field
+
+
+def make_boards(field_class, n, seed=0):
+    """ 同じシードから同じ盤面の組を作る
+
+    :param field_class: 盤面のクラス (Field / BitField)
+    :param n: 盤面数
+    :param seed: 乱数シード
+    :return: 盤面の配列
+    """
+    rng = random.Random(seed)
+    return [make_board(field_class(), rng, rng.randrange(0, 15), rng.uniform(0.3, 0.9)) for _ in range(n)]
+
+
+def per_call(func, number):
+    """ 1回あたりの時間(マイクロ秒)を計測する
+
+    :param func: 計測する関数
+    :param number: 呼び出し回数
+    :return: 1回あたりの時間(マイクロ秒)
+    """
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def bench_candidates(field_class, n_boards=200):
+    """ get_candidate_list で1秒あたりに生成できる落下候補数を計測する
+
+    :param field_class: 盤面のクラス
+    :param n_boards: 盤面数
+    :return: 落下候補数/秒
+    """
+    boards = make_boards(field_class, n_boards)
+    start = time.perf_counter()
+    n = 0
+    for field in boards:
+        for t in range(7):
+            n += len(get_candidate_list(Tetrimino(5, 2, 0, t), field))
+    return n / (time.perf_counter() - start)
+
+
+def bench_field_score(field_class, n_boards=200):
+    """ get_field_score (落下候補を置いた状態) 1回あたりの時間を計測する
+
+    :param field_class: 盤面のクラス
+    :param n_boards: 盤面数
+    :return: マイクロ秒
+    """
+    calls = []
+    for field in make_boards(field_class, n_boards):
+        calls += [(field, m.get_blocks()) for m in get_candidate_list(Tetrimino(5, 2, 0, 6), field)]
+    return per_call(lambda: [field.get_field_score(blocks) for field, blocks in calls], 5) / len(calls)
+
+
+def bench_line_erase(field_class, number=2000):
+    """ 埋まった行が4行ある密な盤面での line_erase 1回あたりの時間を計測する
+
+    :param field_class: 盤面のクラス
+    :param number: 呼び出し回数
+    :return: マイクロ秒 (盤面の準備時間は含まない)
+    """
+    rng = random.Random(0)
+    total = 0
+    for _ in range(number):
+        field = make_board(field_class(), rng, 16, 0.8)
+        field.set_blocks([(x, y, 0) for y in (16, 17, 18, 19) for x in range(1, 11)])
+        start = time.perf_counter()
+        field.line_erase()
+        total += time.perf_counter() - start
+    return total / number * 1e6
+
+
+def bench_activate(backend, n_candidates=34, number=10000):
+    """ モデル評価1回あたりの時間を計測する
+
+    :param backend: 'numpy' または 'torch'
+    :param n_candidates: activate_batch / select に渡す候補数
+    :param number: 計測する呼び出し回数
+    :return: dict (activate, select の1回あたりの時間(マイクロ秒))
+    """
+    from network import create_network
+
+    rng = np.random.default_rng(0)
+    model = create_network(rng.uniform(-1, 1, 9), backend=backend)
+    x = rng.integers(0, 20, 9).astype(float)
+    xs = rng.integers(0, 20, (n_candidates, 9)).astype(float)
+    return {
+        'activate_us': per_call(lambda: model.activate(x), number),
+        'select_us': per_call(lambda: model.select(xs), number),
+    }
+
+
+def bench_startup(backend, repeat=5):
+    """ モデルを1つ生成するまでのプロセス起動時間を計測する
+
+    :param backend: 'numpy' または 'torch'
+    :param repeat: 計測回数
+    :return: 起動時間の中央値(秒)
+    """
+    code = "from network import create_network; create_network(backend='{}')".format(backend)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=REPO_DIR)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def bench_games(n_games=5):
+    """ 固定のモデルとシードで描画無しのゲームを最後までPlayする速度を計測する
+
+    :param n_games: ゲーム数
+    :return: dict (games/秒, pieces/秒)
+    """
+    from evaluator import play_ai
+    from network import create_network
+    from piece_source import PieceSource
+    from feature_cache import shared_cache
+
+    # ほどほどの長さのゲームになるウエイト (高さ・穴・凸凹を嫌う)
+    model = create_network(np.array([-0.5, -1, -0.2, -0.2, -0.5, -0.2, 0, -0.1, 0.5]))
+    shared_cache.clear()
+    pieces = 0
+    start = time.perf_counter()
+    for seed in range(n_games):
+        source = PieceSource(seed)
+        play_ai(model, source)
+        pieces += source.count
+    elapsed = time.perf_counter() - start
+    return {'games_per_s': n_games / elapsed, 'pieces_per_s': pieces / elapsed}
+
+
+def bench_lookahead(width, n_moves=300):
+    """ 先読み探索の1手あたりの展開ノード数と時間を計測する (ビーム幅の調整用)
+
+    :param width: ビーム幅
+    :param n_moves: 計測する手数
+    :return: dict (nodes/手, ミリ秒/手)
+    """
+    from network import create_network
+    from piece_source import PieceSource
+    from feature_cache import FeatureCache
+    from search import get_next_lookahead, SearchStats
+    from bitfield import create_field
+
+    model = create_network(np.array([-0.5, -1, -0.2, -0.2, -0.5, -0.2, 0, -0.1, 0.5]))
+    cache = FeatureCache()
+    stats = SearchStats()
+    source = PieceSource(0)
+    field = create_field()
+    while stats.moves < n_moves:
+        mino = source.next()
+        if mino.collision(field):
+            field = create_field()
+            continue
+        mino = get_next_lookahead(model, mino, field, source.peek()[0], width=width, budget=None,
+                                  cache=cache, stats=stats)
+        field.set_blocks(mino.get_blocks())
+        field.line_erase()
+    summary = stats.summary()
+    return {'nodes_per_move': summary['nodes_per_move'], 'ms_per_move': summary['ms_per_move']}
+
+
+def bench_generation(pop_size=50):
+    """ 1世代(全個体の評価と次世代の生成)にかかる時間を計測する
+
+    :param pop_size: 個体数
+    :return: 秒
+    """
+    from population import Population
+    from evaluator import evaluate_population
+    from feature_cache import shared_cache
+
+    shared_cache.clear()
+    population = Population(size=pop_size, rng=np.random.default_rng(0))
+    start = time.perf_counter()
+    population.fitnesses[:] = evaluate_population(population.weights, [0, 1, 2])
+    Population(size=pop_size, old_population=population)
+    return time.perf_counter() - start
+
+
+def field_engines(field_classes):
+    """ 盤面の実装に JitField を加えて返す (numba が無い環境では加えない)
+
+    :param field_classes: 盤面のクラスの配列
+    :return: 盤面のクラスのタプル
+    """
+    if numba is None:
+        return tuple(field_classes)
+    # コンパイルの時間は計測に含めない
+    warm_up()
+    return tuple(field_classes) + (JitField,)
+
+
+def run_benchmarks(quick=False):
+    """ 全てのベンチマークを実行する
+
+    :param quick: True の場合は重いもの(ゲーム, 世代)を省略する
+    :return: dict (ベンチマーク名: 結果)
+    """
+    results = {}
+    for field_class in field_engines((Field, BitField)):
+        name = field_class.__name__
+        results['candidates_per_s.' + name] = bench_candidates(field_class)
+        results['field_score_us.' + name] = bench_field_score(field_class)
+        results['line_erase_us.' + name] = bench_line_erase(field_class)
+    for backend in ('numpy', 'torch'):
+        # torch は任意の依存なので入っていない場合だけ省略する (numpy で失敗した場合は例外のまま)
+        if backend == 'torch' and importlib.util.find_spec('torch') is None:
+            print("skip torch benchmarks: torch is not installed", file=sys.stderr)
+            continue
+        results['startup_s.' + backend] = bench_startup(backend)
+        for key, value in bench_activate(backend).items():
+            results[key + '.' + backend] = value
+    if not quick:
+        results.update(bench_games())
+        for width in (1, 4, 8, 16):
+            for key, value in bench_lookahead(width).items():
+                results['lookahead_{}.beam{}'.format(key, width)] = value
+        results['generation_s'] = bench_generation()
+    return results
+
+
+def check_engine(field_class, n_boards=300, seed=0):
+    """ 高速な盤面の実装が基準の Field と同じ結果になるかランダムな盤面で確認する
+
+    当たり判定、各列の高さ、盤面キー、落下候補、盤面評価値、行の消去を比較する
+
+    :param field_class: 確認する盤面のクラス
+    :param n_boards: 盤面数
+    :param seed: 乱数シード
+    :return: 不一致の内容の配列 (空であれば一致)
+    """
+    errors = []
+    for i, (ref, field) in enumerate(zip(make_boards(Field, n_boards, seed), make_boards(field_class, n_boards, seed))):
+        if ref.get_column_tops() != field.get_column_tops():
+            errors.append("board {}: get_column_tops".format(i))
+        for t in range(7):
+            for r in range(ROTATIONS[t]):
+                for x in range(12):
+                    for y in range(0, 19):
+                        if ref.collision(MINO_TABLE[t][r], x, y) != field.collision(MINO_TABLE[t][r], x, y):
+                            errors.append("board {}: collision t={} r={} x={} y={}".format(i, t, r, x, y))
+            ref_candidates = get_candidate_list(Tetrimino(5, 2, 0, t), ref)
+            candidates = get_candidate_list(Tetrimino(5, 2, 0, t), field)
+            if [(m.x, m.y, m.r, m.s) for m in ref_candidates] != [(m.x, m.y, m.r, m.s) for m in candidates]:
+                errors.append("board {}: get_candidate_list t={}".format(i, t))
+                continue
+            for m in ref_candidates:
+                blocks = m.get_blocks()
+                if not np.array_equal(ref.get_field_score(blocks), field.get_field_score(blocks)):
+                    errors.append("board {}: get_field_score {}".format(i, blocks))
+                if ref.get_board_key(blocks) != field.get_board_key(blocks):
+                    errors.append("board {}: get_board_key {}".format(i, blocks))
+        if ref.line_erase() != field.line_erase() or ref.tiles != field.tiles:
+            errors.append("board {}: line_erase".format(i))
+        elif not np.array_equal(ref.get_field_score(), field.get_field_score()):
+            errors.append("board {}: get_field_score after line_erase".format(i))
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tetris_ai のベンチマーク")
+    parser.add_argument("--check", action="store_true", help="ベンチマークの代わりに高速な実装の結果を確認する")
+    parser.add_argument("--quick", action="store_true", help="ゲームと世代のベンチマークを省略する")
+    parser.add_argument("--json", metavar="FILE", help="結果をJSONで保存する")
+    args = parser.parse_args()
+
+    if args.check:
+        failed = False
+        for field_class in field_engines((BitField,)):
+            errors = check_engine(field_class)
+            for error in errors[:20]:
+                print(error)
+            print("{}: {}".format(field_class.__name__, "ok" if not errors else "{} mismatches".format(len(errors))))
+            failed = failed or bool(errors)
+        sys.exit(1 if failed else 0)
+
+    results = run_benchmarks(args.quick)
+    for key, value in results.items():
+        print("{:32s} {:12.3f}".format(key, value))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
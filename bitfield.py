@@ -0,0 +1,349 @@
+import warnings
+import numpy as np
+from field import Field
+from profiler import timed
+from config import field_engine
+
+
+def bit_count(v):
+    """ 整数の1のビット数を数える
+
+    :param v: 整数
+    :return: 1のビット数
+    """
+    return bin(v).count("1")
+
+
+def column_stats(mask):
+    """ 列のビットマスク(bit y = y行目)から列の統計情報を求める
+
+    :param mask: 列のビットマスク
+    :return: (最も上のブロックのy座標(無ければ20), 穴の数, 列遷移数)
+    """
+    if not mask:
+        return 20, 0, 0
+    top = (mask & -mask).bit_length() - 1
+    holes = 20 - top - bit_count(mask)
+    # top から 18 行目までの各行と1つ下の行の違いを数える
+    transitions = bit_count((mask ^ (mask >> 1)) & ((1 << 19) - (1 << top)))
+    return top, holes, transitions
+
+
+def row_transition(row):
+    """ 行のビットマスクから行遷移数(隣り合う列の違いの数, 壁は含めない)を求める
+
+    :param row: 行のビットマスク
+    :return: 行遷移数
+    """
+    return bit_count(((row ^ (row >> 1)) >> 1) & 0x1FF)
+
+
+class BitField(Field):
+    """ ビットボードで盤面を管理するクラス
+
+    Field と同じAPIを持つが、盤面の各行を整数(ビットマスク)1つで表現する
+    ・bit x が 1 = 壁 or 埋まっているブロック
+    ・bit x が 0 = 空き
+    当たり判定、ブロックの確定、行の消去がビット演算だけで済むので高速
+    ブロック色は描画する場合のみ必要なので colors=True の場合だけ別の2次元配列で保持する
+
+    盤面評価値の計算用に、各列の高さ・穴の数・列遷移数、各行の埋まっている数・行遷移数を
+    set_blocks / line_erase で更新しながら保持する
+    rows を直接書き換えた場合は update_stats を呼ぶこと
+    """
+
+    WIDTH = 12
+    HEIGHT = 20
+    EMPTY_ROW = 0b100000000001   # 両端の壁のみ
+    FULL_ROW = 0b111111111111    # 埋まっている行 (床も同じ値)
+    AREA_SHIFTS = np.arange(1, 11)
+
+    def __init__(self, colors=True):
+        """ イニシャライザ
+
+        self.rows が盤面を表す整数の配列 (高さ20マス + 床)
+
+        :param colors: True の場合はブロック色も保持する(描画用)
+        """
+        self.rows = [self.EMPTY_ROW] * self.HEIGHT + [self.FULL_ROW]
+        self.colors = None
+        if colors:
+            self.colors = [list(self.EMPTY_LINE) for _ in range(self.HEIGHT)] + [list(self.FLOOR_LINE)]
+        self.update_stats()
+
+    def update_stats(self):
+        """ 盤面の統計情報を rows から全て計算し直す
+
+        cols: 列ごとのビットマスク (bit y = y行目)
+        tops: 列ごとの最も上のブロックのy座標 (ブロックが無い列は 20)
+        holes: 列ごとの穴の数
+        col_trans: 列ごとの列遷移数
+        row_fill: 行ごとの埋まっているマスの数 (壁は含めない)
+        row_trans: 行ごとの行遷移数
+        ※列の配列は x座標をそのままインデックスにする(0 と 11 は壁なので使わない)
+
+        :return:
+        """
+        rows = self.rows
+        self.cols = [0] * self.WIDTH
+        for y in range(self.HEIGHT):
+            for x in range(1, 11):
+                if (rows[y] >> x) & 1:
+                    self.cols[x] |= 1 << y
+        self.tops = [0] * self.WIDTH
+        self.holes = [0] * self.WIDTH
+        self.col_trans = [0] * self.WIDTH
+        for x in range(1, 11):
+            self.tops[x], self.holes[x], self.col_trans[x] = column_stats(self.cols[x])
+        self.row_fill = [bit_count(row) - 2 for row in rows[:self.HEIGHT]]
+        self.row_trans = [row_transition(row) for row in rows[:self.HEIGHT]]
+
+    def copy(self):
+        """ 同じ盤面の複製を返す (先読みで盤面を仮に進める場合に使う)
+
+        統計情報も複製するので計算し直さない
+
+        :return: BitField
+        """
+        field = BitField.__new__(BitField)
+        field.rows = list(self.rows)
+        field.colors = None if self.colors is None else [list(row) for row in self.colors]
+        field.cols = list(self.cols)
+        field.tops = list(self.tops)
+        field.holes = list(self.holes)
+        field.col_trans = list(self.col_trans)
+        field.row_fill = list(self.row_fill)
+        field.row_trans = list(self.row_trans)
+        return field
+
+    @property
+    def tiles(self):
+        """ Field 互換の盤面の2次元配列を生成して返す (参照用)
+
+        :return: 盤面の2次元配列 (9 = 壁, -1 = 空き, 0-6 = ブロック色)
+        """
+        return [[self.get_tile(x, y) for x in range(self.WIDTH)] for y in range(self.HEIGHT + 1)]
+
+    def get_tile(self, x, y):
+        """ 指定のタイルのブロック状況を返す
+
+        色を保持していない場合、埋まっているブロックは 0 を返す
+
+        :param x: x座標
+        :param y: y座標
+        :return: 与えられた座標にセットされている盤面の値
+        """
+        if not (self.rows[y] >> x) & 1:
+            return -1
+        if self.colors is not None:
+            return self.colors[y][x]
+        if x == 0 or x == self.WIDTH - 1 or y == self.HEIGHT or y == -1:
+            return 9
+        return 0
+
+    def get_line(self, y):
+        """ 指定の行のブロック状況を返す (描画の差分検出用)
+
+        色を保持している場合は色の配列をそのまま使う (空きは -1, 壁は 9 のまま保持している)
+
+        :param y: y座標
+        :return: 行の各タイルの値のタプル
+        """
+        if self.colors is not None:
+            return tuple(self.colors[y])
+        return tuple(self.get_tile(x, y) for x in range(self.WIDTH))
+
+    def set_blocks(self, blocks):
+        """ ブロックを盤面に確定反映する
+
+        :param blocks:
+        :return:
+        """
+        rows = self.rows
+        cols = self.cols
+        for x, y, c in blocks:
+            rows[y] |= 1 << x
+            cols[x] |= 1 << y
+            if self.colors is not None:
+                self.colors[y][x] = c
+        # ブロックを置いた列と行の統計情報だけを更新する
+        for x, y, _ in blocks:
+            self.tops[x], self.holes[x], self.col_trans[x] = column_stats(cols[x])
+            self.row_fill[y] = bit_count(rows[y]) - 2
+            self.row_trans[y] = row_transition(rows[y])
+
+    def collision(self, shape, x, y):
+        """ テトリミノの形を指定位置に置いた場合の当たり判定
+
+        行ごとのビットマスクとの論理積で判定する
+
+        :param shape: テトリミノの形 (MinoShape)
+        :param x: テトリミノの位置 x
+        :param y: テトリミノの位置 y
+        :return: True 当たり判定あり / False なし
+        """
+        left = x + shape.min_x
+        if left < 0 or x + shape.max_x > 10:
+            return True
+        rows = self.rows
+        for dy, mask in shape.row_masks:
+            if rows[y + dy] & (mask << left):
+                return True
+        return False
+
+    @timed('BitField.line_erase')
+    def line_erase(self):
+        """ 埋まった行があればそれを消す関数
+
+        :return: 消去された行数
+        """
+        rows = self.rows
+        keep = [y for y in range(self.HEIGHT) if rows[y] != self.FULL_ROW]
+        n = self.HEIGHT - len(keep)
+        if n == 0:
+            return 0
+        # 埋まっていない行だけを残し、消去した分だけ最上部に空の行を追加する
+        self.rows = [self.EMPTY_ROW] * n + [rows[y] for y in keep] + [self.FULL_ROW]
+        if self.colors is not None:
+            self.colors = [list(self.EMPTY_LINE) for _ in range(n)] + \
+                          [self.colors[y] for y in keep] + [self.colors[self.HEIGHT]]
+        # 行の統計情報も同じように詰め、列のビットマスクは消去した行のビットを取り除いて詰める
+        self.row_fill = [0] * n + [self.row_fill[y] for y in keep]
+        self.row_trans = [0] * n + [self.row_trans[y] for y in keep]
+        erased = [y for y in range(self.HEIGHT) if rows[y] == self.FULL_ROW]
+        for x in range(1, 11):
+            mask = self.cols[x]
+            for y in erased:
+                mask = (mask & ~((1 << (y + 1)) - 1)) | ((mask & ((1 << y) - 1)) << 1)
+            self.cols[x] = mask
+            self.tops[x], self.holes[x], self.col_trans[x] = column_stats(mask)
+        return n
+
+    def get_bit_field(self, candidate_blocks=None):
+        """ 盤面の評価用の-1, 1 の2値の盤面値を返す関数
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で応答する
+        :return: 盤面の2次元配列(埋まっている:1, 空いている:0). (壁は含めない)
+        """
+        return self.get_area(candidate_blocks).tolist()
+
+    def get_column_tops(self):
+        """ 各列で最も上にあるブロックの行を返す (落下位置の計算用)
+
+        :return: x座標ごとの最も上のブロックのy座標 (ブロックが無い列は床の 20, 壁の列は 0)
+        """
+        return list(self.tops)
+
+    @timed('BitField.get_field_score')
+    def get_field_score(self, candidate_blocks=None):
+        """ 盤面の評価値を返す
+
+        盤面を作り直さずに、保持している統計情報とテトリミノを置いた列・行の差分だけから計算する
+        値は Field.get_field_score と同じ
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で評価する
+        :return: 9つの1次元配列 (Numpy array型)
+        """
+        tops = self.tops[1:11]
+        holes = self.holes[1:11]
+        col_trans = self.col_trans[1:11]
+        row_trans = self.row_trans
+        cleared = self.row_fill.count(10)
+        if candidate_blocks:
+            cols = {}
+            rows = {}
+            for x, y, _ in candidate_blocks:
+                cols[x] = cols.get(x, self.cols[x]) | (1 << y)
+                rows[y] = rows.get(y, self.rows[y]) | (1 << x)
+            for x, mask in cols.items():
+                tops[x - 1], holes[x - 1], col_trans[x - 1] = column_stats(mask)
+            row_trans = list(row_trans)
+            for y, row in rows.items():
+                row_trans[y] = row_transition(row)
+                if row == self.FULL_ROW and self.row_fill[y] != 10:
+                    cleared += 1
+
+        peaks = [self.HEIGHT - top for top in tops]
+        highest_peak = max(peaks)
+        # 隣り合う列の高さの差から凸凹数と最大井戸高さ(左右どちらかの列との差の最大値)を求める
+        diffs = [peaks[i + 1] - peaks[i] for i in range(9)]
+        bumpiness = sum(map(abs, diffs))
+        max_wells = max(0, max(diffs), -min(diffs))
+
+        return np.array([sum(peaks), sum(holes), 10 - holes.count(0),
+                         sum(row_trans[self.HEIGHT - highest_peak:]), sum(col_trans), bumpiness,
+                         peaks.count(0), max_wells, cleared], dtype=float)
+
+    def get_board_key(self, candidate_blocks=None):
+        """ 盤面のブロック配置を1つの整数(200bit)にまとめて返す (キャッシュのキー用)
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で応答する
+        :return: 各行の壁を除いた10bitを上の行から順に並べた整数 (Field.get_board_key と同じ値)
+        """
+        rows = self.rows[:self.HEIGHT]
+        if candidate_blocks:
+            for x, y, _ in candidate_blocks:
+                rows[y] |= 1 << x
+        key = 0
+        for row in rows:
+            key = (key << 10) | ((row >> 1) & 0x3FF)
+        return key
+
+    def get_area(self, candidate_blocks=None):
+        """ 盤面を Numpy 配列で返す
+
+        各行のビットマスクをまとめてシフトして 20x10 の0/1配列に展開する
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で応答する
+        :return: 盤面の2次元配列 (Numpy array型 20x10)
+        """
+        rows = self.rows[:self.HEIGHT]
+        if candidate_blocks:
+            for x, y, _ in candidate_blocks:
+                rows[y] |= 1 << x
+        return (np.array(rows)[:, np.newaxis] >> self.AREA_SHIFTS) & 1
+
+
+def create_field(colors=False):
+    """ config.field_engine に応じた盤面を生成する
+
+    'jit' は numba が無い環境では BitField を使う
+
+    :param colors: ブロック色を保持するか(描画する場合は True)
+    :return: JitField, BitField または Field のインスタンス
+    """
+    if field_engine == 'jit':
+        from jitfield import JitField, numba
+        if numba is not None:
+            return JitField(colors)
+        warnings.warn("numba is not installed; field_engine 'jit' falls back to 'bitboard'")
+        return BitField(colors)
+    if field_engine == 'bitboard':
+        return BitField(colors)
+    return Field()
+
+
+if __name__ == "__main__":
+    import random
+    from tetrimino import Tetrimino
+
+    # 同じ手順でブロックを置いて Field と結果(盤面評価値を含む)が一致するか確認する
+    # また差分で更新した統計情報が計算し直した値と一致するかも確認する
+    random.seed(0)
+    for _ in range(200):
+        ref = Field()
+        bit = BitField()
+        for _ in range(60):
+            mino = Tetrimino(random.randrange(1, 11), random.randrange(2, 19), random.randrange(4), random.randrange(7))
+            assert mino.collision(ref) == mino.collision(bit)
+            if mino.collision(ref):
+                continue
+            assert (ref.get_field_score(mino.get_blocks()) == bit.get_field_score(mino.get_blocks())).all()
+            ref.set_blocks(mino.get_blocks())
+            bit.set_blocks(mino.get_blocks())
+            assert ref.line_erase() == bit.line_erase()
+            assert ref.tiles == bit.tiles
+            stats = (bit.cols, bit.tops, bit.holes, bit.col_trans, bit.row_fill, bit.row_trans)
+            bit.update_stats()
+            assert stats == (bit.cols, bit.tops, bit.holes, bit.col_trans, bit.row_fill, bit.row_trans)
+    print("ok")
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+from config import input_size
+
+
+def checkpoint_dtype(size):
+    """ チェックポイントのレコード形式(固定長)を返す
+
+    generation: 世代数
+    weights: 各個体のウエイト (個体数 x input_size)
+    fitnesses: 各個体の評価値
+    best_weights, best_fitness: これまでで最も評価値の高い個体
+    rng_state: 乱数生成器(PCG64)の state, inc (各128bit を上位/下位64bitに分割)
+    rng_has_uint32, rng_uinteger: 乱数生成器のその他の状態
+
+    :param size: 個体数
+    :return: numpy.dtype
+    """
+    return np.dtype([
+        ('generation', '<i8'),
+        ('weights', '<f4', (size, input_size)),
+        ('fitnesses', '<f8', (size,)),
+        ('best_weights', '<f4', (input_size,)),
+        ('best_fitness', '<f8'),
+        ('rng_state', '<u8', (4,)),
+        ('rng_has_uint32', '<i8'),
+        ('rng_uinteger', '<u8'),
+    ])
+
+
+def save_checkpoint(path, generation, population, best_weights, best_fitness):
+    """ チェックポイントを保存する
+
+    1レコードの構造化配列を .npy 形式で一時ファイルに書き込んでから置き換える(途中で止まっても壊れない)
+    np.load(path, mmap_mode='r') でメモリマップして中身を確認できる
+
+    :param path: 保存先のファイル名
+    :param generation: 評価が終わった世代数
+    :param population: 評価が終わった世代の Population
+    :param best_weights: これまでで最も評価値の高い個体のウエイト
+    :param best_fitness: その評価値
+    :return:
+    """
+    state = population.rng.bit_generator.state
+    record = np.zeros((), dtype=checkpoint_dtype(population.size))
+    record['generation'] = generation
+    record['weights'] = population.weights
+    record['fitnesses'] = population.fitnesses
+    record['best_weights'] = best_weights
+    record['best_fitness'] = best_fitness
+    mask = (1 << 64) - 1
+    record['rng_state'] = [state['state']['state'] >> 64, state['state']['state'] & mask,
+                           state['state']['inc'] >> 64, state['state']['inc'] & mask]
+    record['rng_has_uint32'] = state['has_uint32']
+    record['rng_uinteger'] = state['uinteger']
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, record)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """ チェックポイントを読み込む
+
+    :param path: save_checkpoint で保存したファイル名
+    :return: dict (generation, weights, fitnesses, best_weights, best_fitness, rng_state)
+             rng_state は numpy.random.PCG64 の state にそのままセットできる形式
+    """
+    record = np.load(path)
+    state = [int(v) for v in record['rng_state']]
+    return {
+        'generation': int(record['generation']),
+        'weights': record['weights'].copy(),
+        'fitnesses': record['fitnesses'].copy(),
+        'best_weights': record['best_weights'].copy(),
+        'best_fitness': float(record['best_fitness']),
+        'rng_state': {
+            'bit_generator': 'PCG64',
+            'state': {'state': (state[0] << 64) | state[1], 'inc': (state[2] << 64) | state[3]},
+            'has_uint32': int(record['rng_has_uint32']),
+            'uinteger': int(record['rng_uinteger']),
+        },
+    }
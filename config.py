@@ -10,3 +10,50 @@ output_size = 1             # PyTouch NetworkモデルのOutput次数
 weights_init_min = -1       # PyTouch 初期ウエイト下限
 weights_init_max = 1        # PyTouch 初期ウエイト上限
 device = 'cpu'              # PyTouch は CPU を利用する
+
+field_engine = 'bitboard'   # 盤面の実装 'bitboard' (BitField) / 'list' (Field) / 'jit' (JitField. numba が必要. 無ければ 'bitboard')
+evaluation_engine = 'pool'  # 個体の評価方法 'pool' (プロセスプールで並列) / 'lockstep' (全個体を同時に進める) / 'serial' (1個体づつ)
+num_workers = None          # 'pool' で評価する場合のプロセス数 (None = CPU数, 1 = プロセスを使わず順に評価)
+chunk_size = 1              # 'pool' で1回にワーカーへ渡す個体数
+seed = None                 # 評価に使う乱数のシード (None = 毎回異なる)
+
+headless = False            # True の場合は pygame を使わずに(画面無しで)学習する
+preview_interval = 1        # 何世代ごとにプレビューを描画するか (それ以外の世代は描画せずにPlayする)
+preview_games = 5           # 各世代のプレビューでPlayする回数
+
+piece_mode = 'uniform'      # テトリミノの生成方法 'uniform' (7種から一様) / 'bag' (7種1セットをシャッフル)
+piece_buffer_size = 256     # まとめて生成しておくテトリミノの数
+feature_cache_size = 0      # 盤面評価値のキャッシュに保持する盤面の最大数 (0 = キャッシュしない. ヒット率が15%程度なのでどの盤面の実装でも計算し直す方が速い)
+model_backend = 'numpy'     # モデルの実装 'numpy' (Network) / 'torch' (TorchNetwork. torch が必要)
+
+checkpoint_path = 'checkpoint.npy'  # チェックポイントの保存先 (main.py --resume checkpoint.npy で再開)
+checkpoint_interval = 1     # 何世代ごとにチェックポイントを保存するか (0 = 保存しない)
+
+profiling = False           # True の場合は処理(候補生成, 盤面評価, モデル評価, 行消去, プレビュー)ごとの時間を計測する
+log_path = 'train_log.jsonl'  # 各世代の評価値の統計と処理時間を書き出すJSON-linesファイル (None = 書き出さない)
+
+lookahead = False           # True の場合は次のテトリミノまで先読みして(2手の組み合わせで)落下位置を決める
+beam_width = 8              # 先読みで次のテトリミノまで展開する候補数 (1手目の評価値の上位)
+lookahead_budget = None     # 先読み1手あたりの時間の上限(秒). 超えたら展開済みの候補から選ぶ (None = 上限なし. 結果が再現する)
+
+evaluation_mode = 'full'    # 'full' (全個体を同じゲーム数で評価) / 'racing' (短いゲームで下位を足切りし, 残った個体だけ多く・長いゲームで評価)
+max_pieces = None           # 'full' の1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+racing_rounds = [(1, 100), (2, 400), (3, 1500)]  # 'racing' の各ラウンドの (ゲーム数, 1ゲームのテトリミノ数の上限)
+racing_keep = 0.5           # 'racing' の各ラウンドで次のラウンドに進む個体の割合
+
+fitness_store_path = 'fitness_store.npy'  # 個体ごとのゲームの結果の保存先 (同じ個体・シードのゲームは再びPlayしない. None = 保存しない)
+fitness_store_size = 10000  # 保持する個体数の最大数 (最近使われていない個体の結果から削除する)
+fitness_reuse = True        # True の場合は以前の世代で評価された個体(交叉せずに残った個体)の結果を再利用する
+fitness_topup_games = 0     # 結果を再利用する個体に追加でPlayさせるゲーム数 (ばらつきを減らす)
+
+record_replays = False      # True の場合は評価した各ゲームのリプレイを記録する (python replay.py <ファイル> で再生)
+replay_dir = 'replays'      # リプレイの保存先 (各世代の最も評価値の高い個体とこれまでの最良の個体のリプレイだけを残す)
+
+preview_speed = 30          # プレビュー・リプレイの1秒あたりのフレーム数 (0 = 上限なし(早送り))
+preview_background = True   # True の場合はプレビューを別プロセスで描画し、学習はプレビューの終了を待たない (headless では無効)
+
+islands = 1                 # 島モデルの島の数 (2以上の場合は島ごとに別プロセスで Population を進化させる. 1 = 使わない)
+island_size = 50            # 島ごとの個体数
+island_topology = 'ring'    # 移住先 'ring' (次の番号の島) / 'all' (他の全ての島)
+migration_interval = 5      # 何世代ごとに移住させるか (0 = 移住しない)
+migration_size = 2          # 1回に移住させる個体数 (各島の評価値の上位)
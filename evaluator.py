@@ -0,0 +1,334 @@
+import numpy as np
+from multiprocessing import Pool
+from network import create_network, score_features
+from bitfield import create_field
+from search import get_candidate_list, get_next, get_next_lookahead, search_stats
+from piece_source import PieceSource
+from feature_cache import shared_cache
+import profiler
+from fitness_store import weights_key, evaluation_settings
+from replay import ReplayWriter, replay_path
+from config import input_size, num_workers, chunk_size, profiling, lookahead, max_pieces, racing_keep, \
+    fitness_reuse, fitness_topup_games, record_replays, model_backend
+
+
+def eval_network(model, sources=None, max_pieces=max_pieces):
+    """ モデルを自動で3回Playさせてスコアの平均を応答する
+
+    :param model: モデル
+    :param sources: 各ゲームのテトリミノの生成元 (PieceSource の配列). 省略時は再現性なし
+    :param max_pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+    :return: 3回プレイしたスコアの平均値 (全ゲームの各手番での累計スコアの平均)
+    """
+    if sources is None:
+        sources = [PieceSource() for _ in range(3)]
+    return games_fitness(play_games(model, sources, max_pieces))
+
+
+def play_games(model, sources, max_pieces=max_pieces, record=record_replays):
+    """ モデルを各テトリミノの生成元で1回づつPlayさせ、ゲームごとの結果を返す
+
+    各手番の累計スコアの配列の代わりに合計と個数だけを保持する (長いゲームでもメモリは一定)
+
+    :param model: モデル
+    :param sources: 各ゲームのテトリミノの生成元 (PieceSource の配列)
+    :param max_pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+    :param record: True の場合は各ゲームのリプレイを replay_path(ウエイトのハッシュ値, シード) に記録する
+    :return: (ゲーム数 x 2) の配列 (各手番での累計スコアの合計, 手数)
+    """
+    games = np.zeros((len(sources), 2))
+    key = weights_key(model.get_weights()) if record else None
+    for g, source in enumerate(sources):
+        field = create_field()
+        writer = ReplayWriter(replay_path(key, source.seed), source.seed) if record else None
+        score = 0
+        pieces = 0
+        while max_pieces is None or pieces < max_pieces:
+            mino = source.next()
+            pieces += 1
+            if mino.collision(field):
+                break
+            best_mino = get_next(model, mino, field, next_type=source.peek()[0] if lookahead else None)
+            field.set_blocks(best_mino.get_blocks())
+            field.line_erase()
+            score += best_mino.get_score()
+            games[g, 0] += score
+            games[g, 1] += 1
+            if writer is not None:
+                writer.append(best_mino)
+        if writer is not None:
+            writer.close()
+    return games
+
+
+def games_fitness(games):
+    """ ゲームごとの結果から評価値(全ゲームの各手番での累計スコアの平均)を計算する
+
+    累計スコアの合計は整数なので、ゲームをどの順に合計しても同じ値になる
+
+    :param games: (... x ゲーム数 x 2) の配列 (各手番での累計スコアの合計, 手数)
+    :return: 評価値 (手数が0の場合は0)
+    """
+    totals = np.sum(games, axis=-2)
+    return np.divide(totals[..., 0], totals[..., 1], out=np.zeros(totals.shape[:-1]), where=totals[..., 1] > 0)
+
+
+def play_ai(model, source=None):
+    """ モデルを与えて描画無しで1回Playする関数 (preview_ai の描画しない版)
+
+    :param model: モデル
+    :param source: テトリミノの生成元 (PieceSource). 省略時は再現性なし
+    :return: (スコア, 消去ライン数)
+    """
+    if source is None:
+        source = PieceSource()
+    field = create_field()
+    score = 0
+    erase_line = 0
+    while True:
+        mino = source.next()
+        if mino.collision(field):
+            return score, erase_line
+        mino = get_next(model, mino, field, next_type=source.peek()[0] if lookahead else None)
+        field.set_blocks(mino.get_blocks())
+        erase_line += field.line_erase()
+        score += mino.get_score()
+
+
+def eval_weights(args):
+    """ ワーカープロセスで1個体を評価する
+
+    モデルを渡すとpickleが重いのでウエイトだけを受け取りモデルを復元する
+
+    :param args: (9次元のウエイト, 各ゲームの乱数シード, 1ゲームあたりのテトリミノ数の上限)
+    :return: (play_games のゲームごとの結果, ワーカーでの処理時間の計測結果 (計測しない場合は None),
+              先読み探索の集計結果 (先読みしない場合は None), 盤面評価値のキャッシュの集計結果)
+    """
+    weights, seeds, pieces = args
+    model = create_network(weights)
+    games = play_games(model, [PieceSource(s) for s in seeds], pieces)
+    return (games, profiler.pop_stats() if profiling else None, search_stats.pop() if lookahead else None,
+            shared_cache.pop_counts())
+
+
+def create_pool():
+    """ 評価用のプロセスプールを生成する
+
+    :return: multiprocessing.Pool (num_workers が 1 の場合は None (プロセス内で順に評価する))
+    """
+    if num_workers == 1:
+        return None
+    return Pool(num_workers)
+
+
+def evaluate_parallel(pool, weights, seeds, on_done=None, max_pieces=max_pieces, per_game=False):
+    """ 全個体をプロセスプールで並列に評価する
+
+    シードが同じであれば 1個体づつ eval_network で評価した結果と一致する
+
+    :param pool: create_pool で生成したプロセスプール (None の場合はプロセス内で順に評価する)
+    :param weights: 各個体のウエイト (個体数 x 9)
+    :param seeds: 各ゲームの乱数シード (全個体が同じテトリミノ列でPlayする)
+    :param on_done: 個体の評価が終わった際に個体番号を引数に呼ばれる関数
+    :param max_pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+    :param per_game: True の場合は評価値の代わりにゲームごとの結果 (個体数 x ゲーム数 x 2) を返す
+    :return: 各個体の評価値 (個体の順番)
+    """
+    tasks = [(w, seeds, max_pieces) for w in weights]
+    if pool is None:
+        results = map(eval_weights, tasks)
+    else:
+        results = pool.imap(eval_weights, tasks, chunksize=chunk_size)
+    games = np.zeros((len(weights), len(seeds), 2))
+    for i, (result, stats, lookahead_stats, cache_counts) in enumerate(results):
+        games[i] = result
+        shared_cache.merge(cache_counts)
+        if stats is not None:
+            profiler.merge(stats)
+        if lookahead_stats is not None:
+            search_stats.merge(lookahead_stats)
+        if on_done is not None:
+            on_done(i)
+    return games if per_game else games_fitness(games)
+
+
+def evaluate_population(weights, seeds, on_done=None, cache=shared_cache, max_pieces=max_pieces,
+                        per_game=False, record=record_replays):
+    """ 全個体のゲームを同時に1手づつ進めて評価する (eval_networkの一括版)
+
+    各手番で生存している全盤面の候補の盤面評価値を (盤面数 x 候補数 x 9) の配列にまとめ、
+    各盤面の個体のウエイト(個体数 x 9)と1回の行列演算でスコアを計算する (torch のモデルの場合は盤面ごとに計算する)
+    ゲームオーバーになった盤面は順次取り除く
+    先読みする場合(config.lookahead)は盤面ごとに探索木の形が異なるので、盤面ごとに get_next_lookahead で選ぶ
+
+    :param weights: 各個体のウエイト (個体数 x 9)
+    :param seeds: 各ゲームの乱数シード (全個体が同じテトリミノ列でPlayする)
+    :param on_done: 個体の全ゲームが終わった際に個体番号を引数に呼ばれる関数
+    :param cache: 盤面評価値のキャッシュ (FeatureCache)
+    :param max_pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+    :param per_game: True の場合は評価値の代わりにゲームごとの結果 (個体数 x ゲーム数 x 2) を返す
+    :param record: True の場合は各ゲームのリプレイを記録する (play_games と同じ)
+    :return: 各個体の評価値 (eval_network と同じ: 全ゲームの各手番での累計スコアの平均)
+    """
+    weights = np.asarray(weights, dtype=np.float32)
+    n_models = len(weights)
+    games = len(seeds)
+
+    # 盤面 i は 個体 owners[i] の seeds[i % games] のゲームの盤面
+    owners = np.repeat(np.arange(n_models), games)
+    fields = [create_field() for _ in owners]
+    sources = [PieceSource(seeds[i % games]) for i in range(len(owners))]
+    scores = np.zeros(len(owners))
+    remaining = np.full(n_models, games)
+
+    # 盤面ごとに各手番での累計スコアの合計と手数を保持する (play_games と同じ)
+    games_result = np.zeros((len(owners), 2))
+    writers = None
+    if record:
+        keys = [weights_key(w) for w in weights]
+        writers = [ReplayWriter(replay_path(keys[owners[i]], s.seed), s.seed) for i, s in enumerate(sources)]
+
+    # 先読みする場合と torch のモデルで評価する場合は個体ごとのモデルを使う
+    models = [create_network(w) for w in weights] if lookahead or model_backend != 'numpy' else None
+
+    live = list(range(len(owners)))
+    while live:
+        # 新しいテトリミノを生成し、置けない盤面(または上限に達した盤面)はゲームオーバー
+        next_live = []
+        minos = []
+        for i in live:
+            mino = sources[i].next()
+            if mino.collision(fields[i]) or (max_pieces is not None and sources[i].count > max_pieces):
+                if writers is not None:
+                    writers[i].close()
+                remaining[owners[i]] -= 1
+                if remaining[owners[i]] == 0 and on_done is not None:
+                    on_done(owners[i])
+                continue
+            next_live.append(i)
+            minos.append(mino)
+        live = next_live
+        if not live:
+            break
+
+        if lookahead:
+            for i, mino in zip(live, minos):
+                mino = get_next_lookahead(models[owners[i]], mino, fields[i], sources[i].peek()[0], cache=cache)
+                fields[i].set_blocks(mino.get_blocks())
+                fields[i].line_erase()
+                scores[i] += mino.get_score()
+                games_result[i] += (scores[i], 1)
+                if writers is not None:
+                    writers[i].append(mino)
+            continue
+
+        # 全盤面の候補を (盤面数 x 最大候補数 x 9) の配列にまとめる
+        candidates = [get_candidate_list(mino, fields[i]) for i, mino in zip(live, minos)]
+        max_candidates = max(len(c) for c in candidates)
+        features = np.zeros((len(live), max_candidates, input_size), dtype=np.float32)
+        valid = np.zeros((len(live), max_candidates), dtype=bool)
+        for j, (i, candidate) in enumerate(zip(live, candidates)):
+            features[j, :len(candidate)] = [cache.get_field_score(fields[i], m.get_blocks()) for m in candidate]
+            valid[j, :len(candidate)] = True
+
+        # 1回の行列演算で全盤面の全候補を評価し、盤面ごとに最もスコアの高い候補を選ぶ
+        # (torch の場合は serial / pool と同じ結果になるように、盤面ごとに個体のモデルで評価する)
+        if models is None:
+            values = score_features(features, weights[owners[live]][:, np.newaxis, :])
+        else:
+            values = np.zeros((len(live), max_candidates), dtype=np.float32)
+            for j, (i, candidate) in enumerate(zip(live, candidates)):
+                values[j, :len(candidate)] = np.asarray(models[owners[i]].activate_batch(features[j, :len(candidate)]))
+        values[~valid] = -np.inf
+        best = np.argmax(values, axis=1)
+
+        for j, i in enumerate(live):
+            mino = candidates[j][best[j]]
+            fields[i].set_blocks(mino.get_blocks())
+            fields[i].line_erase()
+            scores[i] += mino.get_score()
+            games_result[i] += (scores[i], 1)
+            if writers is not None:
+                writers[i].append(mino)
+
+    games_result = games_result.reshape(n_models, games, 2)
+    return games_result if per_game else games_fitness(games_result)
+
+
+def evaluate_stored(evaluate_games, weights, seeds, store, pieces=max_pieces, reuse=fitness_reuse,
+                    topup=fitness_topup_games):
+    """ FitnessStore に保持した結果を使って評価する (保持していないゲームだけをPlayする)
+
+    ・(ウエイト, シード, 設定) が同じゲームの結果があればそのまま使う (同じ設定で繰り返し実行した場合など)
+    ・reuse が True の場合、以前の世代で評価された個体(交叉せずに残った優秀な個体など)は
+      この世代のゲームを最初の topup ゲームだけPlayし、保持している全ゲームの結果から評価値を計算する
+      (Playするゲームが少ない分速く、世代を重ねるほどゲーム数が増えるので評価値のばらつきが小さくなる)
+
+    :param evaluate_games: 評価関数 evaluate_games(個体番号の配列, 各ゲームの乱数シード) -> ゲームごとの結果
+                           (個体数 x ゲーム数 x 2 の配列. evaluate_population の per_game=True と同じ)
+    :param weights: 各個体のウエイト (個体数 x 9)
+    :param seeds: この世代の各ゲームの乱数シード
+    :param store: FitnessStore
+    :param pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+    :param reuse: 以前の世代で評価された個体の結果を再利用する場合は True
+    :param topup: 再利用する個体に追加でPlayさせるゲーム数
+    :return: 各個体の評価値 (個体の順番)
+    """
+    settings = evaluation_settings(pieces)
+    keys = [weights_key(w) for w in weights]
+    reused = [reuse and store.has(key, settings) for key in keys]
+
+    # Playが必要なゲームの組ごとに個体をまとめて評価する
+    missing = {}
+    for i, key in enumerate(keys):
+        games = seeds[:topup] if reused[i] else seeds
+        needed = tuple(s for s in games if store.get(key, settings, s) is None)
+        if needed:
+            missing.setdefault(needed, []).append(i)
+    for needed, indices in missing.items():
+        results = evaluate_games(np.array(indices), list(needed))
+        for i, result in zip(indices, results):
+            for s, (score_sum, score_count) in zip(needed, result):
+                store.put(keys[i], settings, s, score_sum, score_count)
+
+    fitnesses = np.zeros(len(weights))
+    for i, key in enumerate(keys):
+        if reused[i]:
+            fitnesses[i] = games_fitness(list(store.reuse(key, settings).values()))
+        else:
+            games = store.games(key, settings)
+            fitnesses[i] = games_fitness([games[s] for s in seeds])
+    return fitnesses
+
+
+def evaluate_racing(evaluate, n_models, rounds, on_round=None):
+    """ 短いゲームで下位の個体を足切りしながら評価する (successive halving)
+
+    各ラウンドで残っている個体を (ゲーム数, 1ゲームのテトリミノ数の上限) で評価し、
+    評価値の上位 racing_keep の割合の個体だけが次のラウンドに進む (後のラウンドほど多く・長いゲームを与える)
+    各個体の評価値は最後に評価されたラウンドの評価値. ただし敗退した個体の評価値は
+    次のラウンドに進んだ個体の最低値を超えないようにする(ラウンドの結果と順位が逆転しないようにする)
+
+    :param evaluate: 評価関数 evaluate(個体番号の配列, 各ゲームの乱数シード, テトリミノ数の上限) -> 評価値の配列
+    :param n_models: 個体数
+    :param rounds: 各ラウンドの (各ゲームの乱数シードの配列, 1ゲームのテトリミノ数の上限) の配列
+    :param on_round: 各ラウンドの評価が終わった際に (ラウンド番号, 評価した個体数) を引数に呼ばれる関数
+    :return: 各個体の評価値 (個体の順番)
+    """
+    fitnesses = np.zeros(n_models)
+    alive = np.arange(n_models)
+    for r, (seeds, pieces) in enumerate(rounds):
+        values = evaluate(alive, seeds, pieces)
+        if r > 0:
+            # 前のラウンドで敗退した個体は、このラウンドの個体の最低値で頭打ちにする
+            culled = np.setdiff1d(np.arange(n_models), alive)
+            fitnesses[culled] = np.minimum(fitnesses[culled], values.min())
+        fitnesses[alive] = values
+        if on_round is not None:
+            on_round(r, len(alive))
+        if r == len(rounds) - 1:
+            break
+        # 評価値の高い順に残す (交叉には2個体以上が必要)
+        n_keep = max(2, int(np.ceil(len(alive) * racing_keep)))
+        alive = np.sort(alive[np.argsort(-values, kind='stable')[:n_keep]])
+    return fitnesses
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from config import feature_cache_size
+
+
+class FeatureCache:
+    """ 盤面評価値(Field.get_field_score)のキャッシュを管理するクラス
+
+    盤面評価値は盤面だけで決まるので、盤面のブロック配置(200bitの整数)をキーにして
+    最近使われた順に maxsize 個まで保持する (LRU)
+    同じ世代の個体は同じテトリミノ列でPlayするので、個体をまたいで同じ盤面が繰り返し現れる
+    """
+
+    def __init__(self, maxsize=feature_cache_size):
+        """ イニシャライザ
+
+        :param maxsize: 保持する盤面の最大数 (0 の場合はキャッシュしない)
+        """
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_field_score(self, field, candidate_blocks=None):
+        """ 盤面の評価値を返す (キャッシュに無い場合は計算して保持する)
+
+        :param field: 盤面
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で評価する
+        :return: Field.get_field_score と同じ9つの1次元配列 (書き換え不可)
+        """
+        if self.maxsize == 0:
+            self.misses += 1
+            return field.get_field_score(candidate_blocks)
+        key = field.get_board_key(candidate_blocks)
+        score = self.data.get(key)
+        if score is not None:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return score
+        self.misses += 1
+        score = field.get_field_score(candidate_blocks)
+        score.flags.writeable = False
+        self.data[key] = score
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+        return score
+
+    def pop_counts(self):
+        """ ヒット数などの集計結果を返して、集計結果をクリアする (保持している盤面はクリアしない)
+
+        :return: (hits, misses, evictions)
+        """
+        result = (self.hits, self.misses, self.evictions)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return result
+
+    def merge(self, counts):
+        """ 他のプロセスのキャッシュの集計結果 (pop_counts の戻り値) を合算する
+
+        :param counts: (hits, misses, evictions)
+        :return:
+        """
+        self.hits += counts[0]
+        self.misses += counts[1]
+        self.evictions += counts[2]
+
+    def stats(self):
+        """ キャッシュの統計情報を返す
+
+        ヒット数などは merge で合算した他のプロセスの分も含む (size はこのプロセスのキャッシュの盤面数)
+
+        :return: dict (size, hits, misses, evictions, hit_rate)
+        """
+        total = self.hits + self.misses
+        return {'size': len(self.data), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hits / total if total else 0.0}
+
+    def clear(self):
+        """ キャッシュと統計情報をクリアする
+
+        :return:
+        """
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+# get_next などで共有するキャッシュ (プロセスごとに1つ)
+shared_cache = FeatureCache()
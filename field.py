@@ -1,5 +1,5 @@
-import pygame
 import numpy as np
+from profiler import timed
 import copy
 from config import BLOCK_SIZE
 
@@ -27,6 +27,15 @@ class Field:
         for _ in range(20):
             self.tiles.insert(0, copy.deepcopy(self.EMPTY_LINE))
 
+    def copy(self):
+        """ 同じ盤面の複製を返す (先読みで盤面を仮に進める場合に使う)
+
+        :return: Field
+        """
+        field = Field.__new__(Field)
+        field.tiles = [list(row) for row in self.tiles]
+        return field
+
     def get_tile(self, x, y):
         """ 指定のタイルのブロック状況を返す
 
@@ -36,15 +45,39 @@ class Field:
         """
         return self.tiles[y][x]
 
+    def get_line(self, y):
+        """ 指定の行のブロック状況を返す (描画の差分検出用)
+
+        :param y: y座標
+        :return: 行の各タイルの値のタプル
+        """
+        return tuple(self.tiles[y])
+
     def set_blocks(self, blocks):
         """ ブロックを盤面に確定反映する
 
         :param blocks:
         :return:
         """
-        for block in blocks:
-            self.tiles[block.y][block.x] = block.c
+        for x, y, c in blocks:
+            self.tiles[y][x] = c
+
+    def collision(self, shape, x, y):
+        """ テトリミノの形を指定位置に置いた場合の当たり判定
 
+        :param shape: テトリミノの形 (MinoShape)
+        :param x: テトリミノの位置 x
+        :param y: テトリミノの位置 y
+        :return: True 当たり判定あり / False なし
+        """
+        if x + shape.min_x < 0 or x + shape.max_x > 10:
+            return True
+        for dx, dy in shape.cells:
+            if self.tiles[y + dy][x + dx] != -1:
+                return True
+        return False
+
+    @timed('Field.line_erase')
     def line_erase(self):
         """ 埋まった行があればそれを消す関数
 
@@ -71,14 +104,16 @@ class Field:
         :param colors: pygame の Surface (描画用の色ブロック)
         :return:
         """
-        for y in range(len(self.tiles)):
-            for x in range(len(self.tiles[0])):
-                if self.tiles[y][x] == 9:
+        import pygame  # 描画しない(headless)場合にpygameを読み込まないようにここでimportする
+        tiles = self.tiles
+        for y in range(len(tiles)):
+            for x in range(len(tiles[0])):
+                if tiles[y][x] == 9:
                     pygame.draw.rect(screen, (80, 80, 80), (x*BLOCK_SIZE, y*BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 0)
-                elif self.tiles[y][x] == -1:
+                elif tiles[y][x] == -1:
                     pygame.draw.rect(screen, (80, 80, 80), (x*BLOCK_SIZE, y*BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 1)
                 else:
-                    screen.blit(colors[self.tiles[y][x]], (BLOCK_SIZE*x, BLOCK_SIZE*y, BLOCK_SIZE, BLOCK_SIZE))
+                    screen.blit(colors[tiles[y][x]], (BLOCK_SIZE*x, BLOCK_SIZE*y, BLOCK_SIZE, BLOCK_SIZE))
 
     def get_bit_field(self, candidate_blocks=None):
         """ 盤面の評価用の-1, 1 の2値の盤面値を返す関数
@@ -88,10 +123,44 @@ class Field:
         """
         bit_field = [[0 if self.tiles[y][x] == -1 else 1 for x in range(1, len(self.tiles[0])-1)] for y in range(0, len(self.tiles)-1)]
         if candidate_blocks:
-            for block in candidate_blocks:
-                bit_field[block.y][block.x-1] = 1
+            for x, y, _ in candidate_blocks:
+                bit_field[y][x-1] = 1
         return bit_field
 
+    def get_column_tops(self):
+        """ 各列で最も上にあるブロックの行を返す (落下位置の計算用)
+
+        :return: x座標ごとの最も上のブロックのy座標 (ブロックが無い列は床の 20, 壁の列は 0)
+        """
+        tops = [0] + [20] * 10 + [0]
+        for x in range(1, 11):
+            for y in range(20):
+                if self.tiles[y][x] != -1:
+                    tops[x] = y
+                    break
+        return tops
+
+    def get_board_key(self, candidate_blocks=None):
+        """ 盤面のブロック配置を1つの整数(200bit)にまとめて返す (キャッシュのキー用)
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で応答する
+        :return: 各行を10bit(左端の列が最下位bit)にして上の行から順に並べた整数
+        """
+        key = 0
+        for row in self.get_bit_field(candidate_blocks):
+            for v in reversed(row):
+                key = (key << 1) | v
+        return key
+
+    def get_area(self, candidate_blocks=None):
+        """ get_bit_field の結果を Numpy 配列で返す
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で応答する
+        :return: 盤面の2次元配列 (Numpy array型 20x10)
+        """
+        return np.array(self.get_bit_field(candidate_blocks))
+
+    @timed('Field.get_field_score')
     def get_field_score(self, candidate_blocks=None):
         """ 盤面の評価値を返す
 
@@ -110,21 +179,21 @@ class Field:
         7: 最大井戸高さ
         8: 消去行数
         """
-        area = np.array(self.get_bit_field(candidate_blocks))
+        area = self.get_area(candidate_blocks)
         peaks = self.get_peaks(area)
         highest_peak = np.max(peaks)
         agg_height = np.sum(peaks)
 
         holes = self.get_holes(peaks, area)
         n_holes = np.sum(holes)
-        n_cols_with_holes = np.count_nonzero(np.array(holes) > 0)
+        n_cols_with_holes = np.count_nonzero(holes)
 
         row_transitions = self.get_row_transition(area, highest_peak)
         col_transitions = self.get_col_transition(area, peaks)
 
         bumpiness = self.get_bumpiness(peaks)
 
-        num_pits = np.count_nonzero(np.count_nonzero(area, axis=0) == 0)
+        num_pits = np.count_nonzero(peaks == 0)
 
         wells = self.get_wells(peaks)
         max_wells = np.max(wells)
@@ -138,34 +207,25 @@ class Field:
     def get_peaks(area):
         """高さ計算
 
+        各列で最初にブロックがある行(argmax)から高さを求める
+
         :param area: 盤面
         :return: 各列での最大のブロックの高さ
         """
-        peaks = np.array([])
-        for col in range(area.shape[1]):
-            if 1 in area[:, col]:
-                p = area.shape[0] - np.argmax(area[:, col], axis=0)
-                peaks = np.append(peaks, p)
-            else:
-                peaks = np.append(peaks, 0)
-        return peaks
+        return np.where(area.any(axis=0), area.shape[0] - np.argmax(area, axis=0), 0).astype(float)
 
     @staticmethod
     def get_holes(peaks, area):
         """ 穴数計算
 
+        列方向の累積ORで最も上のブロック以下を求め、その中の空白を数える
+
         :param peaks: get_peaksで得られた値(各列での最大の高さ)
         :param area: 盤面
         :return: 各列での穴(空白)の数
         """
-        holes = []
-        for col in range(area.shape[1]):
-            start = -peaks[col]
-            if start == 0:
-                holes.append(0)
-            else:
-                holes.append(np.count_nonzero(area[int(start):, col] == 0))
-        return holes
+        covered = np.maximum.accumulate(area, axis=0)
+        return np.count_nonzero(covered > area, axis=0)
 
     @staticmethod
     def get_row_transition(area, highest_peak):
@@ -175,12 +235,8 @@ class Field:
         :param highest_peak: 最大のブロック高さ
         :return: 各行の占有タイルから非占有タイルへの遷移の合計数
         """
-        s = 0
-        for row in range(int(area.shape[0] - highest_peak), area.shape[0]):
-            for col in range(1, area.shape[1]):
-                if area[row, col] != area[row, col - 1]:
-                    s += 1
-        return s
+        transitions = area[:, 1:] != area[:, :-1]
+        return np.count_nonzero(transitions[int(area.shape[0] - highest_peak):])
 
     @staticmethod
     def get_col_transition(area, peaks):
@@ -190,14 +246,9 @@ class Field:
         :param peaks: get_peaksで得られた値(各列での最大の高さ)
         :return: 各列の占有タイルから非占有タイルへの遷移の合計数
         """
-        s = 0
-        for col in range(area.shape[1]):
-            if peaks[col] <= 1:
-                continue
-            for row in range(int(area.shape[0] - peaks[col]), area.shape[0] - 1):
-                if area[row, col] != area[row + 1, col]:
-                    s += 1
-        return s
+        transitions = area[1:] != area[:-1]
+        in_stack = np.arange(area.shape[0] - 1)[:, np.newaxis] >= area.shape[0] - peaks
+        return np.count_nonzero(transitions & in_stack)
 
     @staticmethod
     def get_bumpiness(peaks):
@@ -206,10 +257,7 @@ class Field:
         :param peaks: get_peaksで得られた値(各列での最大の高さ)
         :return: 隣り合う列間の絶対的な高さの差の合計
         """
-        s = 0
-        for i in range(9):
-            s += np.abs(peaks[i] - peaks[i + 1])
-        return s
+        return np.sum(np.abs(np.diff(peaks)))
 
     @staticmethod
     def get_wells(peaks):
@@ -218,24 +266,11 @@ class Field:
         :param peaks: get_peaksで得られた値(各列での最大の高さ)
         :return: 各列で最も深い井戸
         """
-        wells = []
-        for i in range(len(peaks)):
-            if i == 0:
-                w = peaks[1] - peaks[0]
-                w = w if w > 0 else 0
-                wells.append(w)
-            elif i == len(peaks) - 1:
-                w = peaks[-2] - peaks[-1]
-                w = w if w > 0 else 0
-                wells.append(w)
-            else:
-                w1 = peaks[i - 1] - peaks[i]
-                w2 = peaks[i + 1] - peaks[i]
-                w1 = w1 if w1 > 0 else 0
-                w2 = w2 if w2 > 0 else 0
-                w = w1 if w1 >= w2 else w2
-                wells.append(w)
-        return wells
+        diff = np.diff(peaks)
+        # 左隣との差(-diff)と右隣との差(diff)の大きい方 (端の列は片側のみ, 負の値は0)
+        left = np.concatenate(([0], -diff))
+        right = np.concatenate((diff, [0]))
+        return np.maximum(np.maximum(left, right), 0)
 
 
 if __name__ == "__main__":
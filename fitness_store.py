@@ -0,0 +1,158 @@
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+from config import piece_mode, lookahead, beam_width, lookahead_budget, model_backend, fitness_store_size
+
+
+def weights_key(weights):
+    """ ウエイトのハッシュ値を返す (float32 のバイト列が同じであれば同じ値)
+
+    :param weights: 9次元のウエイト
+    :return: 64bit の整数
+    """
+    data = np.ascontiguousarray(weights, dtype=np.float32).tobytes()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def evaluation_settings(max_pieces):
+    """ 評価値に影響する評価の設定を表す文字列を返す (設定が異なる評価値は再利用しない)
+
+    :param max_pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+    :return: 文字列
+    """
+    if lookahead:
+        return "{}:{}:{}:{}:{}".format(max_pieces, piece_mode, beam_width, lookahead_budget, model_backend)
+    return "{}:{}:0:None:{}".format(max_pieces, piece_mode, model_backend)
+
+
+class FitnessStore:
+    """ 個体(ウエイト)ごとの各ゲームの結果を保持するクラス
+
+    (ウエイトのハッシュ値, 評価の設定) ごとに {ゲームの乱数シード: (累計スコアの合計, 手数)} を保持する
+    累計スコアは整数なので、保持した結果から計算した評価値は改めてPlayした場合と一致する
+    path を指定した場合は save でファイルに書き出し、次回の起動時に読み込む
+    保持する個体数は maxsize までで、最近使われていない個体から削除する (LRU)
+    (世代をまたいで残った個体、古いチェックポイントから再開した場合の個体、以前の個体と同じウエイトの子の結果を使う)
+    """
+
+    def __init__(self, path=None, maxsize=fitness_store_size):
+        """ イニシャライザ
+
+        :param path: 保存先のファイル名 (None の場合は保存しない. ファイルがあれば読み込む)
+        :param maxsize: 保持する個体数の最大数
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def get(self, key, settings, seed):
+        """ 1ゲームの結果を返す
+
+        :param key: weights_key の値
+        :param settings: evaluation_settings の値
+        :param seed: ゲームの乱数シード
+        :return: (累計スコアの合計, 手数) (無い場合は None)
+        """
+        result = self.data.get((key, settings), {}).get(seed)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.data.move_to_end((key, settings))
+        return result
+
+    def put(self, key, settings, seed, score_sum, score_count):
+        """ 1ゲームの結果を保持する
+
+        :param key: weights_key の値
+        :param settings: evaluation_settings の値
+        :param seed: ゲームの乱数シード
+        :param score_sum: 各手番での累計スコアの合計
+        :param score_count: 手数
+        :return:
+        """
+        self.data.setdefault((key, settings), {})[seed] = (int(score_sum), int(score_count))
+        self.data.move_to_end((key, settings))
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def has(self, key, settings):
+        """ 個体のゲームの結果を1つ以上保持しているか
+
+        :param key: weights_key の値
+        :param settings: evaluation_settings の値
+        :return: True 保持している / False していない
+        """
+        return (key, settings) in self.data
+
+    def reuse(self, key, settings):
+        """ 以前の結果を再利用する個体の全ゲームの結果を返す (統計情報の reused に数える)
+
+        :param key: weights_key の値
+        :param settings: evaluation_settings の値
+        :return: {ゲームの乱数シード: (累計スコアの合計, 手数)}
+        """
+        self.reused += 1
+        self.data.move_to_end((key, settings))
+        return self.games(key, settings)
+
+    def games(self, key, settings):
+        """ 個体の保持している全ゲームの結果を返す
+
+        :param key: weights_key の値
+        :param settings: evaluation_settings の値
+        :return: {ゲームの乱数シード: (累計スコアの合計, 手数)}
+        """
+        return self.data.get((key, settings), {})
+
+    def pop_counts(self):
+        """ ヒット数などの集計結果を返して、集計結果をクリアする (保持している結果はクリアしない)
+
+        :return: (hits, misses, reused)
+        """
+        result = (self.hits, self.misses, self.reused)
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0
+        return result
+
+    def stats(self):
+        """ 統計情報を返す
+
+        :return: dict (genomes, games, hits, misses, reused)
+        """
+        return {'genomes': len(self.data), 'games': sum(len(games) for games in self.data.values()),
+                'hits': self.hits, 'misses': self.misses, 'reused': self.reused}
+
+    def save(self):
+        """ 保持している結果をファイルに書き出す (一時ファイルに書き込んでから置き換える)
+
+        最近使われていない個体から順に書き出すので、読み込むと使われた順番も元に戻る
+
+        :return:
+        """
+        if self.path is None:
+            return
+        records = np.array([(key, settings.encode(), seed, score_sum, score_count)
+                            for (key, settings), games in self.data.items()
+                            for seed, (score_sum, score_count) in games.items()], dtype=[
+            ('key', '<u8'), ('settings', 'S64'), ('seed', '<u8'), ('score_sum', '<i8'), ('score_count', '<i8')])
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, records)
+        os.replace(tmp_path, self.path)
+
+    def load(self, path):
+        """ save で書き出したファイルを読み込む
+
+        :param path: ファイル名
+        :return:
+        """
+        for key, settings, seed, score_sum, score_count in np.load(path).tolist():
+            self.put(key, settings.decode(), seed, score_sum, score_count)
@@ -0,0 +1,111 @@
+import multiprocessing
+import numpy as np
+from population import Population
+from evaluator import evaluate_population, evaluate_stored
+from fitness_store import FitnessStore
+from config import max_pieces, island_topology, migration_interval, migration_size
+
+
+def migration_targets(index, n_islands):
+    """ 島から移住する個体を送る先の島を返す
+
+    ・'ring' = 次の番号の島 (最後の島は最初の島) に送る
+    ・'all' = 他の全ての島に送る
+
+    :param index: 島の番号
+    :param n_islands: 島の数
+    :return: 島の番号の配列
+    """
+    if island_topology == 'ring':
+        return [(index + 1) % n_islands]
+    elif island_topology == 'all':
+        return [i for i in range(n_islands) if i != index]
+    raise ValueError("unknown island topology: {}".format(island_topology))
+
+
+def migration_sources(index, n_islands):
+    """ 島に個体を送ってくる島を返す (migration_targets の逆)
+
+    :param index: 島の番号
+    :param n_islands: 島の数
+    :return: 島の番号の配列
+    """
+    return [i for i in range(n_islands) if index in migration_targets(i, n_islands)]
+
+
+def migrate(index, population, inboxes):
+    """ 評価値の高い個体を他の島に送り、他の島から届いた個体で評価値の低い個体を置き換える
+
+    全ての送り元の島から届くまで待つので、同じシードであれば島の処理の速さによらず同じ結果になる
+
+    :param index: 島の番号
+    :param population: 評価が終わった Population (置き換えた個体は評価値も送り元の値にする)
+    :param inboxes: 各島の受信用キュー
+    :return:
+    """
+    n_islands = len(inboxes)
+    top = np.argsort(-population.fitnesses, kind='stable')[:migration_size]
+    for target in migration_targets(index, n_islands):
+        inboxes[target].put((index, population.weights[top], population.fitnesses[top]))
+
+    # 送り元の番号順に並べてから、評価値の低い個体(優秀な個体以外)と置き換える
+    received = sorted((inboxes[index].get() for _ in migration_sources(index, n_islands)), key=lambda m: m[0])
+    weights = np.concatenate([m[1] for m in received])[:population.size - population.n_elites]
+    fitnesses = np.concatenate([m[2] for m in received])[:len(weights)]
+    worst = np.argsort(population.fitnesses, kind='stable')[:len(weights)]
+    population.weights[worst] = weights
+    population.fitnesses[worst] = fitnesses
+
+
+def island_worker(index, inboxes, reports, seed_sequence, size, generations=None):
+    """ 1つの島の遺伝的アルゴリズムを実行するプロセスの処理
+
+    各世代の全個体を evaluate_population (プロセス内で全個体を同時に進める) で評価し (リプレイは記録しない)、
+    migration_interval 世代ごとに他の島と個体を交換する
+    各世代の結果を reports に送る
+
+    :param index: 島の番号
+    :param inboxes: 各島の受信用キュー
+    :param reports: (島の番号, 世代数, 各個体の評価値, 最も評価値の高い個体のウエイト) を送るキュー
+    :param seed_sequence: この島の乱数のシード (numpy.random.SeedSequence)
+    :param size: 島の個体数
+    :param generations: 世代数 (None = 終了しない)
+    :return:
+    """
+    rng = np.random.default_rng(seed_sequence)
+    population = Population(size=size, rng=rng)
+    store = FitnessStore()
+    generation = 0
+    while generations is None or generation < generations:
+        generation += 1
+        seeds = rng.integers(2**32, size=3).tolist()
+        population.fitnesses[:] = evaluate_stored(
+            lambda indices, s: evaluate_population(population.weights[indices], s, max_pieces=max_pieces,
+                                                   per_game=True, record=False),
+            population.weights, seeds, store, max_pieces)
+        reports.put((index, generation, population.fitnesses.copy(),
+                     population.weights[population.fitnesses.argmax()].copy()))
+        if migration_interval and generation % migration_interval == 0 and len(inboxes) > 1:
+            migrate(index, population, inboxes)
+        population = Population(size=population.size, old_population=population)
+
+
+def start_islands(n_islands, size, seed=None, generations=None):
+    """ 島ごとのプロセスを起動する
+
+    各島の乱数は1つのシードから SeedSequence.spawn で独立に生成する
+
+    :param n_islands: 島の数
+    :param size: 島ごとの個体数
+    :param seed: 乱数シード (None = 毎回異なる)
+    :param generations: 世代数 (None = 終了しない)
+    :return: (島のプロセスの配列, 各世代の結果を受け取るキュー)
+    """
+    inboxes = [multiprocessing.Queue() for _ in range(n_islands)]
+    reports = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=island_worker, daemon=True,
+                                         args=(i, inboxes, reports, seed_sequence, size, generations))
+                 for i, seed_sequence in enumerate(np.random.SeedSequence(seed).spawn(n_islands))]
+    for process in processes:
+        process.start()
+    return processes, reports
@@ -0,0 +1,375 @@
+import numpy as np
+from bitfield import BitField
+from tetrimino import Tetrimino, MINO_TABLE, ROTATIONS
+from profiler import timed
+
+try:
+    import numba
+except ImportError:
+    # numba が無い場合は JitField を使わない (create_field は BitField を返す)
+    numba = None
+
+
+def jit(func):
+    """ numba があれば nopython モードでコンパイルするデコレータ (無ければそのままの関数)
+
+    :param func: 関数
+    :return: 関数
+    """
+    if numba is None:
+        return func
+    return numba.njit(cache=True)(func)
+
+
+WIDTH = 12
+HEIGHT = 20
+EMPTY_ROW = 0b100000000001
+FULL_ROW = 0b111111111111
+MAX_PLACEMENTS = 48         # 1つのテトリミノの落下候補数の上限 (4回転 x 10列 + 余裕)
+
+# テトリミノの形 (MinoShape) を配列にしたもの [タイプ, 回転]
+SHAPE_MIN_X = np.array([[MINO_TABLE[t][r].min_x for r in range(4)] for t in range(7)], dtype=np.int64)
+SHAPE_MAX_X = np.array([[MINO_TABLE[t][r].max_x for r in range(4)] for t in range(7)], dtype=np.int64)
+SHAPE_ROWS = np.array([[len(MINO_TABLE[t][r].row_masks) for r in range(4)] for t in range(7)], dtype=np.int64)
+SHAPE_DY = np.zeros((7, 4, 4), dtype=np.int64)
+SHAPE_MASK = np.zeros((7, 4, 4), dtype=np.int64)
+SHAPE_CELLS = np.array([[MINO_TABLE[t][r].cells for r in range(4)] for t in range(7)], dtype=np.int64)
+for t in range(7):
+    for r in range(4):
+        for k, (dy, mask) in enumerate(MINO_TABLE[t][r].row_masks):
+            SHAPE_DY[t, r, k] = dy
+            SHAPE_MASK[t, r, k] = mask
+# MinoShape から (タイプ, 回転) を引く (同じ形の回転は当たり判定も同じなのでどれでもよい)
+SHAPE_INDEX = {MINO_TABLE[t][r]: (t, r) for t in range(7) for r in range(4)}
+
+
+NO_BLOCKS = np.zeros((0, 3), dtype=np.int64)
+
+
+def blocks_array(blocks):
+    """ テトリミノのブロックをコンパイル済み関数に渡せる int64 の配列にする
+
+    :param blocks: (x, y, 色) タプルの配列 (None でもよい)
+    :return: (ブロック数 x 3) の Numpy 配列
+    """
+    if not blocks:
+        return NO_BLOCKS
+    return np.array(blocks, dtype=np.int64)
+
+
+@jit
+def collide(rows, t, r, x, y):
+    """ テトリミノの当たり判定 (BitField.collision と同じ)
+
+    :param rows: 盤面の各行のビットマスク (int64 配列)
+    :param t: タイプ
+    :param r: 回転 (0-3)
+    :param x: 位置 x
+    :param y: 位置 y
+    :return: True 当たり判定あり / False なし
+    """
+    left = x + SHAPE_MIN_X[t, r]
+    if left < 0 or x + SHAPE_MAX_X[t, r] > 10:
+        return True
+    for k in range(SHAPE_ROWS[t, r]):
+        if rows[y + SHAPE_DY[t, r, k]] & (SHAPE_MASK[t, r, k] << left):
+            return True
+    return False
+
+
+@jit
+def find_placements(rows, t, x0, y0, r0, n_rotations, out):
+    """ 落下可能なテトリミノ候補を全て求める (search.get_candidate_list と同じ順番・同じ値)
+
+    :param rows: 盤面の各行のビットマスク
+    :param t: タイプ
+    :param x0: 初期位置 x
+    :param y0: 初期位置 y
+    :param r0: 初期の回転
+    :param n_rotations: 回転のバリエーション数
+    :param out: 結果を書き込む (MAX_PLACEMENTS x 4) の配列 (x, 落下後の y, 回転, 落下量)
+    :return: 候補数
+    """
+    n = 0
+    for i in range(n_rotations):
+        r = (r0 + i) % 4
+        x = x0
+        while not collide(rows, t, r, x - 1, y0):
+            x -= 1
+        while True:
+            drop = 0
+            while not collide(rows, t, r, x, y0 + drop + 1):
+                drop += 1
+            out[n, 0] = x
+            out[n, 1] = y0 + drop
+            out[n, 2] = r0 + i
+            out[n, 3] = drop
+            n += 1
+            if collide(rows, t, r, x + 1, y0):
+                break
+            x += 1
+    return n
+
+
+@jit
+def erase_lines(rows):
+    """ 埋まった行を消して詰める (rows を書き換える)
+
+    :param rows: 盤面の各行のビットマスク
+    :return: 消去された行数
+    """
+    write = HEIGHT - 1
+    for y in range(HEIGHT - 1, -1, -1):
+        if rows[y] != FULL_ROW:
+            rows[write] = rows[y]
+            write -= 1
+    for y in range(write, -1, -1):
+        rows[y] = EMPTY_ROW
+    return write + 1
+
+
+@jit
+def column_tops(rows):
+    """ 各列で最も上にあるブロックの行を返す (BitField.get_column_tops と同じ)
+
+    :param rows: 盤面の各行のビットマスク
+    :return: 12列の配列 (壁の列は 0, ブロックが無い列は 20)
+    """
+    tops = np.zeros(WIDTH, dtype=np.int64)
+    for x in range(1, 11):
+        tops[x] = HEIGHT
+        for y in range(HEIGHT):
+            if (rows[y] >> x) & 1:
+                tops[x] = y
+                break
+    return tops
+
+
+@jit
+def place(rows, blocks):
+    """ テトリミノを置いた盤面の各行を返す
+
+    :param rows: 盤面の各行のビットマスク
+    :param blocks: テトリミノのブロック (blocks_array の値)
+    :return: 盤面の各行のビットマスク (複製)
+    """
+    board = rows[:HEIGHT].copy()
+    for i in range(blocks.shape[0]):
+        board[blocks[i, 1]] |= 1 << blocks[i, 0]
+    return board
+
+
+@jit
+def field_score(rows, blocks):
+    """ 盤面評価値の9つの値を求める (Field.get_field_score と同じ値)
+
+    :param rows: 盤面の各行のビットマスク
+    :param blocks: 次に配置されたと仮定するテトリミノのブロック (blocks_array の値)
+    :return: 9つの1次元配列
+    """
+    board = place(rows, blocks)
+    peaks = np.zeros(10, dtype=np.int64)
+    n_holes = 0
+    n_cols_with_holes = 0
+    col_transitions = 0
+    for i in range(10):
+        x = i + 1
+        top = HEIGHT
+        filled = 0
+        for y in range(HEIGHT):
+            bit = (board[y] >> x) & 1
+            if bit and top == HEIGHT:
+                top = y
+            filled += bit
+        if top < HEIGHT:
+            peaks[i] = HEIGHT - top
+            holes = HEIGHT - top - filled
+            n_holes += holes
+            if holes > 0:
+                n_cols_with_holes += 1
+            # top から 18 行目までの各行と1つ下の行の違いを数える
+            for y in range(top, HEIGHT - 1):
+                if ((board[y] >> x) & 1) != ((board[y + 1] >> x) & 1):
+                    col_transitions += 1
+
+    highest_peak = peaks.max()
+    row_transitions = 0
+    cleared = 0
+    for y in range(HEIGHT):
+        if board[y] == FULL_ROW:
+            cleared += 1
+        if y >= HEIGHT - highest_peak:
+            changes = ((board[y] ^ (board[y] >> 1)) >> 1) & 0x1FF
+            while changes:
+                changes &= changes - 1
+                row_transitions += 1
+
+    bumpiness = 0
+    max_wells = 0
+    for i in range(9):
+        diff = peaks[i + 1] - peaks[i]
+        bumpiness += abs(diff)
+        max_wells = max(max_wells, abs(diff))
+    num_pits = 0
+    for i in range(10):
+        if peaks[i] == 0:
+            num_pits += 1
+
+    score = np.empty(9)
+    score[0] = peaks.sum()
+    score[1] = n_holes
+    score[2] = n_cols_with_holes
+    score[3] = row_transitions
+    score[4] = col_transitions
+    score[5] = bumpiness
+    score[6] = num_pits
+    score[7] = max_wells
+    score[8] = cleared
+    return score
+
+
+@jit
+def board_key_parts(rows, blocks):
+    """ 盤面キー (Field.get_board_key) を64bitに収まる4つの部分に分けて求める
+
+    :param rows: 盤面の各行のビットマスク
+    :param blocks: 次に配置されたと仮定するテトリミノのブロック (blocks_array の値)
+    :return: (0-5行目, 6-11行目, 12-17行目, 18-19行目) をそれぞれ10bitづつ並べた4つの整数の配列
+    """
+    board = place(rows, blocks)
+    parts = np.zeros(4, dtype=np.int64)
+    for y in range(HEIGHT):
+        k = y // 6
+        parts[k] = (parts[k] << 10) | ((board[y] >> 1) & 0x3FF)
+    return parts
+
+
+def warm_up():
+    """ 全てのコンパイル済み関数を1度呼び出してコンパイル (またはキャッシュの読み込み) を済ませておく
+
+    :return:
+    """
+    field = JitField(colors=False)
+    field.get_placements(Tetrimino(5, 2, 0, 0))
+    field.get_field_score(((1, 19, 0),))
+    field.get_board_key(((1, 19, 0),))
+    field.get_column_tops()
+    field.get_area()
+    field.line_erase()
+
+
+class JitField(BitField):
+    """ numba でコンパイルした関数で盤面を処理するクラス
+
+    BitField と同じく盤面の各行をビットマスクで表現するが、int64 の Numpy 配列で保持し、
+    当たり判定・落下候補の探索・行の消去・盤面評価値の計算をそれぞれ1回のコンパイル済み関数の呼び出しで行う
+    統計情報は保持しない (盤面評価値は毎回全て計算する)
+    numba が無い環境では create_field は BitField を使う
+    """
+
+    def __init__(self, colors=True):
+        """ イニシャライザ
+
+        :param colors: True の場合はブロック色も保持する(描画用)
+        """
+        self.rows = np.array([self.EMPTY_ROW] * self.HEIGHT + [self.FULL_ROW], dtype=np.int64)
+        self.colors = None
+        if colors:
+            self.colors = [list(self.EMPTY_LINE) for _ in range(self.HEIGHT)] + [list(self.FLOOR_LINE)]
+        self.placements = np.zeros((MAX_PLACEMENTS, 4), dtype=np.int64)
+
+    def update_stats(self):
+        """ 統計情報は保持しないので何もしない
+
+        :return:
+        """
+
+    def copy(self):
+        """ 同じ盤面の複製を返す
+
+        :return: JitField
+        """
+        field = JitField.__new__(JitField)
+        field.rows = self.rows.copy()
+        field.colors = None if self.colors is None else [list(row) for row in self.colors]
+        field.placements = np.zeros((MAX_PLACEMENTS, 4), dtype=np.int64)
+        return field
+
+    def set_blocks(self, blocks):
+        """ ブロックを盤面に確定反映する
+
+        :param blocks:
+        :return:
+        """
+        for x, y, c in blocks:
+            self.rows[y] |= 1 << x
+            if self.colors is not None:
+                self.colors[y][x] = c
+
+    def collision(self, shape, x, y):
+        """ テトリミノの形を指定位置に置いた場合の当たり判定
+
+        :param shape: テトリミノの形 (MinoShape)
+        :param x: テトリミノの位置 x
+        :param y: テトリミノの位置 y
+        :return: True 当たり判定あり / False なし
+        """
+        t, r = SHAPE_INDEX[shape]
+        return collide(self.rows, t, r, x, y)
+
+    def get_placements(self, init_mino):
+        """ 落下可能なテトリミノ候補を全て返す (search.get_candidate_list から呼ばれる)
+
+        :param init_mino: 与えられたテトリミノ
+        :return: 落下可能な位置にあるテトリミノ配列 (get_candidate_list と同じ)
+        """
+        t = init_mino.get_type()
+        n = find_placements(self.rows, t, init_mino.x, init_mino.y, init_mino.r, ROTATIONS[t], self.placements)
+        return [Tetrimino(x, y, r, t, s) for x, y, r, s in self.placements[:n].tolist()]
+
+    @timed('JitField.line_erase')
+    def line_erase(self):
+        """ 埋まった行があればそれを消す関数
+
+        :return: 消去された行数
+        """
+        if self.colors is not None:
+            keep = [y for y in range(self.HEIGHT) if self.rows[y] != self.FULL_ROW]
+            n = self.HEIGHT - len(keep)
+            self.colors = [list(self.EMPTY_LINE) for _ in range(n)] + \
+                          [self.colors[y] for y in keep] + [self.colors[self.HEIGHT]]
+        return int(erase_lines(self.rows))
+
+    def get_column_tops(self):
+        """ 各列で最も上にあるブロックの行を返す (落下位置の計算用)
+
+        :return: 12列の配列 (壁の列は 0, ブロックが無い列は 20)
+        """
+        return column_tops(self.rows).tolist()
+
+    @timed('JitField.get_field_score')
+    def get_field_score(self, candidate_blocks=None):
+        """ 盤面の評価値を返す
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で評価する
+        :return: 9つの1次元配列 (Numpy array型. 値は Field.get_field_score と同じ)
+        """
+        return field_score(self.rows, blocks_array(candidate_blocks))
+
+    def get_board_key(self, candidate_blocks=None):
+        """ 盤面のブロック配置を1つの整数(200bit)にまとめて返す (キャッシュのキー用)
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で応答する
+        :return: Field.get_board_key と同じ値
+        """
+        a, b, c, d = board_key_parts(self.rows, blocks_array(candidate_blocks)).tolist()
+        return (((((a << 60) | b) << 60) | c) << 20) | d
+
+    def get_area(self, candidate_blocks=None):
+        """ 盤面を Numpy 配列で返す
+
+        :param candidate_blocks: 現在の盤面に特定のテトリミノが次に配置されたと仮定した状況で応答する
+        :return: 盤面の2次元配列 (Numpy array型 20x10)
+        """
+        board = place(self.rows, blocks_array(candidate_blocks))
+        return (board[:, np.newaxis] >> self.AREA_SHIFTS) & 1
@@ -1,212 +1,318 @@
-import pygame
+import argparse
+import os
+import time
+import warnings
 import numpy as np
 from population import Population
-from field import Field
-from play import make_colors, generate_tetrimino
-
-
-def get_candidate_list(init_mino, field):
-    """ 盤面の状況を踏まえて落下可能なテトリミノ候補をすべて返す
-
-    :param init_mino: 与えられたテトリミノ
-    :param field: 盤面
-    :return: 落下可能な位置にあるテトリミノ配列 (落下の高さに応じてscore値をセットする)
-    """
-    candidate = []
-    rotete_num = 1
-    mino_type = init_mino.get_type()
-
-    # タイプによって回転のバリエーションが2 or 4 となる
-    if 1 <= mino_type <= 3:
-        rotete_num = 2
-    if mino_type >= 4:
-        rotete_num = 4
-
-    # 各回転パターンに応じて
-    for i in range(rotete_num):
-        mino = init_mino.clone(0, 0, i)
-
-        # まずは最も左に寄せる
-        while True:
-            next_mino = mino.clone(-1, 0, 0)
-            if next_mino.collision(field):
-                break
-            mino = next_mino
-        base_mino = mino
-
-        while True:
-            mino = base_mino
-            score = 0
-            while True:
-                # 可能なところまで落下させる
-                next_mino = mino.clone(0, 1, 0)
-                if next_mino.collision(field):
-                    break
-                mino = next_mino
-                score += 1
-            mino.set_score(score)
-            candidate.append(mino)
-
-            # １つづつ右に移動させる
-            next_mino = base_mino.clone(1, 0, 0)
-            if next_mino.collision(field):
-                break
-            base_mino = next_mino
-    return candidate
-
-
-def get_next(model, mino, field):
-    """ モデルと盤面から与えれたテトリミノが落下位置を計算する
-
-    :param model: モデル
-    :param mino:  移動対象のテトリミノ
-    :param field: 現在の盤面
-    :return: 落下後の盤面のスコアが最も高いテトリミノ(落下後位置)
-    """
-
-    # 回転や左右移動を行って落下可能な候補を全て計算する
-    candidate_mino = get_candidate_list(mino, field)
-    max_score = np.NINF
-    best_mino = None
-    for m in candidate_mino:
-        # 各落下候補において落下後の盤面の評価を行う(スコア計算を行う)
-        field_score = field.get_field_score(m.get_blocks())
-        s = model.activate(field_score)
-        if max_score < s:
-            best_mino = m
-            max_score = s
-    # 最もスコア値の高い落下位置を戻す
-    return best_mino
-
-
-def eval_network(model):
-    """ モデルを自動で3回Playさせてスコアの平均を応答する
-
-    :param model: モデル
-    :return: 3回プレイしたスコアの平均値
-    """
-    scores = []
-    for i in range(3):
-        field = Field()
-        i += 1
-        score = 0
-        while True:
-            mino = generate_tetrimino()
-            if mino.collision(field):
-                break
-            best_mino = get_next(model, mino, field)
-            field.set_blocks(best_mino.get_blocks())
-            field.line_erase()
-            score += best_mino.get_score()
-            scores.append(score)
-
-    return np.average(scores)
-
-
-def preview_ai(model):
+from network import create_network
+from bitfield import create_field
+from search import get_next, search_stats
+from evaluator import play_games, evaluate_population, evaluate_parallel, evaluate_racing, \
+    evaluate_stored, create_pool, play_ai
+from fitness_store import FitnessStore, weights_key
+from replay import prune_replays, replay_dir
+from preview_process import PreviewProcess
+from islands import start_islands
+from piece_source import PieceSource
+from checkpoint import save_checkpoint, load_checkpoint
+import profiler
+from profiler import timed
+from feature_cache import shared_cache
+from config import evaluation_engine, seed, headless, preview_interval, preview_games, \
+    checkpoint_path, checkpoint_interval, profiling, log_path, lookahead, evaluation_mode, max_pieces, racing_rounds, \
+    fitness_store_path, record_replays, preview_speed, preview_background, islands, island_size
+
+
+@timed('preview_ai')
+def preview_ai(model, source=None, stop=None):
     """ モデルを与えて自動でPlayする関数
     移動のアニメーションは無し、テトリミノが生成されたらモデルから算出された
     落下位置に一気に移動する
+    ウィンドウは最初の呼び出しで開き、以降の呼び出しでも同じものを使う (閉じられた後は描画せずにPlayする)
 
     :param model: モデル
-    :return:
+    :param source: テトリミノの生成元 (PieceSource). 省略時は再現性なし
+    :param stop: 各手番の前に呼ばれ、True を返すとそこでPlayを止める関数 (省略時は最後までPlayする)
+    :return: (スコア, 消去ライン数)
     """
-    pygame.init()
-    screen = pygame.display.set_mode((640, 480))
-    pygame.display.set_caption("tetris_ai")
-    clock = pygame.time.Clock()
-    colors = make_colors()
-    font = pygame.font.SysFont("Arial", 40)
+    if source is None:
+        source = PieceSource()
+    # headless の場合は呼ばれないので pygame はここで読み込む
+    from renderer import get_renderer
 
-    field = Field()
+    renderer = get_renderer()
+    if renderer is None:
+        return play_ai(model, source)
+
+    field = create_field(colors=True)
 
     score = 0
     erase_line = 0
-    game_over_flag = False
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return
-        if game_over_flag:
+    while stop is None or not stop():
+        # テトリミノを生成する
+        mino = source.next()
+
+        renderer.draw_text("score: {}".format(score), (300, 100))
+        renderer.draw_text("erase: {}".format(erase_line), (300, 150))
+        renderer.draw_field(field)
+        renderer.draw_mino(mino)
+        if renderer.update(preview_speed) is None:
             return score, erase_line
 
-        # ランダムにテトリミノを生成する
-        mino = generate_tetrimino()
-        screen.fill((0, 0, 0))
-
-        screen.blit(font.render("score: {}".format(score), True, (255, 255, 255)), (300, 100))
-        screen.blit(font.render("erase: {}".format(erase_line), True, (255, 255, 255)), (300, 150))
-
-        field.draw(screen, colors)
-        mino.draw(screen, colors)
-        pygame.display.update()
-        clock.tick(30)
-
         # 生成した時点で当たり判定であればGame Over
         if mino.collision(field):
-            game_over_flag = True
+            return score, erase_line
 
         # モデルと盤面の状況から落下位置を算出する
-        mino = get_next(model, mino, field)
+        mino = get_next(model, mino, field, next_type=source.peek()[0] if lookahead else None)
         field.set_blocks(mino.get_blocks())
-        field.draw(screen, colors)
 
-        screen.fill((0, 0, 0))
-        field.draw(screen, colors)
-        pygame.display.update()
+        renderer.draw_field(field)
+        if renderer.update(preview_speed) is None:
+            return score, erase_line
 
         # 消去可能な行があれば消去
-        erase = field.line_erase()
-        if erase > 0:
-            clock.tick(30)
-            erase_line += erase
-        else:
-            clock.tick(30)
-
+        erase_line += field.line_erase()
         score += mino.get_score()
+    return score, erase_line
 
 
-def main():
-    """メイン関数
+def preview(model, iteration, seeds):
+    """ モデルを preview_games 回Playさせてその平均スコアをアウトプットする
 
-    遺伝的アルゴリズムを用いて世代を繰り返す
-    各世代の最もスコアの高い個体はプレビューを5回行いその平均スコアをアウトプットする
-    :return:
+    headless の場合や preview_interval 世代ごと以外は描画せずに高速にPlayする
+
+    :param model: モデル
+    :param iteration: 世代数
+    :param seeds: 各Playの乱数シード
+    :return: (平均スコア, 平均消去ライン数)
     """
-    pop_size = 50  # 各遺伝世代における個体数
-    population = Population(size=pop_size)
+    render = not headless and iteration % preview_interval == 0
     score = 0
     lines = 0
-    for i in range(5):
-        s, l = preview_ai(population.models[0])
+    for i in range(preview_games):
+        source = PieceSource(seeds[i])
+        s, l = preview_ai(model, source) if render else play_ai(model, source)
         score += s
         lines += l
-    print("score: {} line: {}".format(score/5, lines/5))
+    print("score: {} line: {}".format(score/preview_games, lines/preview_games))
+    return score/preview_games, lines/preview_games
+
+
+def evaluate(population, pool, indices, seeds, pieces):
+    """ evaluation_engine で指定した方法で個体を評価する (ゲームごとの結果を返す)
+
+    :param population: Population
+    :param pool: create_pool で生成したプロセスプール ('pool' の場合)
+    :param indices: 評価する個体番号の配列
+    :param seeds: 各ゲームの乱数シード (全個体が同じテトリミノ列でPlayする)
+    :param pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+    :return: (個体数 x ゲーム数 x 2) の配列 (各手番での累計スコアの合計, 手数) (indices の順番)
+    """
+    if evaluation_engine == 'lockstep':
+        # 全個体を同時に1手づつ進めて評価する
+        return evaluate_population(population.weights[indices], seeds, on_done=lambda i: print("*", end=""),
+                                   max_pieces=pieces, per_game=True)
+    elif evaluation_engine == 'pool':
+        # プロセスプールで並列に評価する (ウエイトだけをワーカーに渡す)
+        return evaluate_parallel(pool, population.weights[indices], seeds, on_done=lambda i: print("*", end=""),
+                                 max_pieces=pieces, per_game=True)
+    games = np.zeros((len(indices), len(seeds), 2))
+    for j, i in enumerate(indices):
+        games[j] = play_games(population.get_model(i), [PieceSource(s) for s in seeds], pieces)
+        print("*", end="")
+    return games
+
+
+def best_replays(weights):
+    """ 個体の記録済みのリプレイのファイル名を返す
+
+    :param weights: 個体のウエイト
+    :return: ファイル名の配列
+    """
+    prefix = "{:016x}_".format(weights_key(weights))
+    if not os.path.isdir(replay_dir):
+        return []
+    return sorted(os.path.join(replay_dir, name) for name in os.listdir(replay_dir) if name.startswith(prefix))
 
 
-    iteration = 0
+def main_islands():
+    """ 島モデルのメイン関数
+
+    islands 個の島(それぞれ island_size 個体の Population)を別々のプロセスで進化させ、
+    migration_interval 世代ごとに評価値の高い個体を島の間で移住させる (islands.py)
+    このプロセスは各島の結果を受け取り、全ての島の世代が揃ったらプレビューとログの書き出しを行う
+    :return:
+    """
+    reports = start_islands(islands, island_size, seed)[1]
+    # プレビューの各ゲームのシードに使う乱数
+    rng = np.random.default_rng(seed)
+    previewer = PreviewProcess() if preview_background and not headless else None
+    best_fitness = -np.inf
+    pending = {}
+    while True:
+        index, generation, fitnesses, weights = reports.get()
+        print("island {} - {} : max: {} mean: {}".format(index, generation, fitnesses.max(), fitnesses.mean()))
+        pending.setdefault(generation, []).append((index, fitnesses, weights))
+        if len(pending[generation]) < islands:
+            continue
+
+        # 全ての島でこの世代の評価が終わった
+        results = sorted(pending.pop(generation), key=lambda r: r[0])
+        maxima = [r[1].max() for r in results]
+        best_island = int(np.argmax(maxima))
+        best_fitness = max(best_fitness, maxima[best_island])
+        best_weights = results[best_island][2]
+        print("{} : best: {} (island {})".format(generation, maxima[best_island], best_island))
+
+        seeds = rng.integers(2**32, size=preview_games).tolist()
+        if previewer is not None:
+            if generation % preview_interval == 0:
+                previewer.send(generation, best_weights, seeds)
+            preview_result = previewer.poll()
+        else:
+            preview_result = (generation,) + preview(create_network(best_weights), generation, seeds)
+
+        if log_path:
+            profiler.write_log(log_path, {
+                'generation': generation,
+                'fitness': {'max': max(maxima), 'best_so_far': best_fitness,
+                            'mean': float(np.mean([r[1].mean() for r in results])),
+                            'min': min(r[1].min() for r in results)},
+                'islands': [{'max': r[1].max(), 'mean': r[1].mean()} for r in results],
+                'preview': None if preview_result is None else dict(zip(('generation', 'score', 'lines'),
+                                                                        preview_result)),
+            })
+
+
+def main(resume=None):
+    """メイン関数
+
+    遺伝的アルゴリズムを用いて世代を繰り返す
+    各世代の最もスコアの高い個体はプレビューを preview_games 回行いその平均スコアをアウトプットする
+    checkpoint_interval 世代ごとにチェックポイントを保存する
+    :param resume: 再開するチェックポイントのファイル名 (省略時は最初から)
+    :return:
+    """
+    if islands > 1:
+        if resume is not None:
+            raise ValueError("--resume is not supported with islands > 1")
+        if evaluation_mode == 'racing':
+            raise ValueError("evaluation_mode 'racing' is not supported with islands > 1")
+        # 島は各プロセスで全個体を同時に進めて評価し、ゲームの結果はプロセス内だけで保持する
+        if evaluation_engine != 'lockstep':
+            warnings.warn("evaluation_engine '{}' is ignored with islands > 1 (islands use lockstep)"
+                          .format(evaluation_engine))
+        if checkpoint_interval:
+            warnings.warn("checkpoints are not saved with islands > 1")
+        if fitness_store_path:
+            warnings.warn("fitness_store_path is ignored with islands > 1 (each island keeps results in memory)")
+        if record_replays:
+            warnings.warn("record_replays is ignored with islands > 1")
+        return main_islands()
+
+    pop_size = 50  # 各遺伝世代における個体数
+    # 遺伝的アルゴリズムと各ゲームのシードに使う乱数 (seed を指定すると再現可能になる)
+    rng = np.random.default_rng(seed)
+    pool = create_pool() if evaluation_engine == 'pool' else None
+    # 描画する場合は別プロセスでプレビューする (学習はプレビューの終了を待たない)
+    previewer = PreviewProcess() if preview_background and not headless else None
+    # 個体ごとのゲームの結果 (交叉せずに残った個体や、チェックポイントから再開した場合の個体は再びPlayしない)
+    store = FitnessStore(fitness_store_path)
+
+    if resume is None:
+        population = Population(size=pop_size, rng=rng)
+        best_weights = population.weights[0]
+        best_fitness = -np.inf
+        iteration = 0
+        seeds = rng.integers(2**32, size=preview_games).tolist()
+        if previewer is not None:
+            previewer.send(0, population.weights[0], seeds)
+        else:
+            preview(population.get_model(0), 0, seeds)
+    else:
+        # チェックポイントの世代の評価が終わった状態から次世代を生成して再開する
+        state = load_checkpoint(resume)
+        population = Population(size=len(state['weights']), rng=rng)
+        population.weights = state['weights']
+        population.fitnesses = state['fitnesses']
+        rng.bit_generator.state = state['rng_state']
+        best_weights = state['best_weights']
+        best_fitness = state['best_fitness']
+        iteration = state['generation']
+        print("resume: {} (best: {})".format(iteration, best_fitness))
+        population = Population(size=population.size, old_population=population)
+
     while True:
         iteration += 1
         print("{} : ".format(iteration), end="")
-        for i in range(pop_size):
-            population.fitnesses[i] = eval_network(population.models[i])
-            print("*".format(iteration), end="")
+        start = time.perf_counter()
+        if evaluation_mode == 'racing':
+            # 各ラウンドの全個体は同じテトリミノ列(同じシード)のゲームで評価し、ラウンドごとに下位を足切りする
+            rounds = [(rng.integers(2**32, size=games).tolist(), pieces) for games, pieces in racing_rounds]
+            population.fitnesses[:] = evaluate_racing(
+                lambda indices, seeds, pieces: evaluate_stored(
+                    lambda j, s: evaluate(population, pool, indices[j], s, pieces),
+                    population.weights[indices], seeds, store, pieces, reuse=False),
+                population.size, rounds, on_round=lambda r, n: print(" ", end=""))
+        else:
+            # 同じ世代の全個体は同じテトリミノ列(同じシード)の3ゲームで評価する
+            seeds = rng.integers(2**32, size=3).tolist()
+            population.fitnesses[:] = evaluate_stored(
+                lambda indices, s: evaluate(population, pool, indices, s, max_pieces),
+                population.weights, seeds, store, max_pieces)
         print()
+        eval_time = time.perf_counter() - start
 
         print(population.fitnesses)
         best_model_idx = population.fitnesses.argmax()
-        best_model = population.models[best_model_idx]
-        score = 0
-        lines = 0
-        for i in range(5):
-            s, l = preview_ai(best_model)
-            score += s
-            lines += l
-        print("score: {} line: {}".format(score/5, lines/5))
-
-        population = Population(size=pop_size, old_population=population)
+        best_model = population.get_model(best_model_idx)
+        if population.fitnesses[best_model_idx] > best_fitness:
+            best_weights = population.weights[best_model_idx].copy()
+            best_fitness = population.fitnesses[best_model_idx]
+        seeds = rng.integers(2**32, size=preview_games).tolist()
+        if previewer is not None:
+            if iteration % preview_interval == 0:
+                previewer.send(iteration, population.weights[best_model_idx], seeds)
+            # ログにはこれまでに届いた最新のプレビューの結果を書き出す
+            preview_result = previewer.poll()
+        else:
+            preview_result = (iteration,) + preview(best_model, iteration, seeds)
+
+        if log_path:
+            # 各世代の評価値の統計と(計測している場合は)処理ごとの時間をログに書き出す
+            profiler.write_log(log_path, {
+                'generation': iteration,
+                'fitness': {'max': population.fitnesses.max(), 'mean': population.fitnesses.mean(),
+                            'min': population.fitnesses.min()},
+                'preview': None if preview_result is None else dict(zip(('generation', 'score', 'lines'),
+                                                                        preview_result)),
+                'eval_s': eval_time,
+                'feature_cache': shared_cache.stats(),
+                'fitness_store': store.stats(),
+                'timings': profiler.summary() if profiling else None,
+                'lookahead': search_stats.summary() if lookahead else None,
+                'replays': best_replays(population.weights[best_model_idx]) if record_replays else None,
+            })
+            # ログの各行はその世代の集計結果にする (保持している盤面・結果の数は除く)
+            profiler.stats.clear()
+            search_stats.clear()
+            shared_cache.pop_counts()
+            store.pop_counts()
+
+        # ゲームの結果を先に保存する (チェックポイントから再開した場合に残した個体の結果が使えるように)
+        store.save()
+        if checkpoint_interval and iteration % checkpoint_interval == 0:
+            save_checkpoint(checkpoint_path, iteration, population, best_weights, best_fitness)
+
+        population = Population(size=population.size, old_population=population)
+        if record_replays:
+            # 次世代の個体とこれまでの最良の個体以外のリプレイは削除する
+            prune_replays({weights_key(w) for w in population.weights} | {weights_key(best_weights)})
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", metavar="CHECKPOINT", help="チェックポイントから学習を再開する")
+    args = parser.parse_args()
+    main(args.resume)
@@ -1,32 +1,96 @@
-import torch
-import torch.nn as nn
-from config import input_size, output_size, weights_init_max, weights_init_min, device
+import numpy as np
+from profiler import timed
+from config import input_size, weights_init_max, weights_init_min, model_backend
 
 
-class Network(nn.Module):
-    """ PyTouchのモデル
+@timed('score_features')
+def score_features(features, weights):
+    """ 盤面評価値とウエイトの内積(モデル評価値)を計算する
 
-    単純な1層の線形関数のネットワーク
+    候補1つ分(9)、候補の行列(候補数 x 9)、盤面ごとの候補(盤面数 x 候補数 x 9)のどれでも
+    同じ計算順序(float32で最後の次元の和)になるので、まとめて計算しても結果が変わらない
+
+    :param features: (... x 9)の盤面評価値
+    :param weights: featuresにブロードキャストできる(... x 9)のウエイト
+    :return: (...)の評価値 (float32)
+    """
+    return np.sum(np.asarray(features, dtype=np.float32) * weights, axis=-1, dtype=np.float32)
+
+
+class Network:
+    """ NumPyのモデル (config.model_backend = 'numpy' の場合に使う)
+
+    単純な1層の線形関数(バイアス無し)
     Input=9, Output=1 (InputはField.get_field_scoreで得られた盤面評価値(9次のNumpy.Array)
+    学習(逆伝搬)はしないので、ウエイトとの内積を計算するだけ
     """
-    def __init__(self):
-        super(Network, self).__init__()
-        # 線形関数１層のみ
-        self.output = nn.Linear(
-            input_size, output_size, bias=False).to(device)
-        # 今回は逆伝搬は必要ない
-        self.output.weight.requires_grad_(False)
-        # ウエイトを,一様分布で初期化
-        nn.init.uniform_(self.output.weight,
-                         a=weights_init_min, b=weights_init_max)
 
+    def __init__(self, weights=None):
+        """ イニシャライザ
+
+        :param weights: 9次元のウエイト(Numpy.Array). 省略時は一様分布で初期化する
+        """
+        if weights is None:
+            weights = np.random.uniform(weights_init_min, weights_init_max, input_size)
+        self.set_weights(weights)
+
+    def get_weights(self):
+        """ ウエイトを返す
+
+        :return: 9次元ベクトル(Numpy.Array float32)
+        """
+        return self.weights.copy()
+
+    def set_weights(self, weights):
+        """ ウエイトをセットする
+
+        :param weights: 9次元ベクトル(Numpy.Array)
+        :return:
+        """
+        self.weights = np.array(weights, dtype=np.float32)
+
+    @timed('Network.activate')
     def activate(self, x):
         """ 与えられたベクトルでモデル評価値を返す
 
         :param x: 9次元ベクトル(Numpy.Array)
         :return: 1次元ベクトル(評価結果)
         """
-        with torch.no_grad():
-            x = torch.from_numpy(x).float().to(device)
-            x = self.output(x)
-        return x
+        return score_features(x, self.weights)[np.newaxis]
+
+    def activate_batch(self, xs):
+        """ 複数のベクトルをまとめてモデル評価する
+
+        :param xs: (候補数 x 9)の行列(Numpy.Array)
+        :return: 候補ごとの評価値 (1次元ベクトル)
+        """
+        return score_features(xs, self.weights)
+
+    @timed('Network.select')
+    def select(self, xs):
+        """ 複数のベクトルを1回でモデル評価し、評価値が最も高いものを選ぶ
+
+        :param xs: (候補数 x 9)の行列(Numpy.Array)
+        :return: (最も評価値が高い行のインデックス, その評価値)
+        """
+        scores = self.activate_batch(xs)
+        best = int(np.argmax(scores))
+        return best, scores[best]
+
+
+def create_network(weights=None, backend=None):
+    """ config.model_backend に応じたモデルを生成する
+
+    torch は 'torch' が指定された場合にだけ import する
+
+    :param weights: 9次元のウエイト(Numpy.Array). 省略時は一様分布で初期化する
+    :param backend: 'numpy' または 'torch' (省略時は config.model_backend)
+    :return: Network または TorchNetwork のインスタンス
+    """
+    backend = backend or model_backend
+    if backend == 'torch':
+        from torch_network import TorchNetwork
+        return TorchNetwork(weights)
+    if backend != 'numpy':
+        raise ValueError("unknown model backend: {}".format(backend))
+    return Network(weights)
@@ -0,0 +1,85 @@
+import random
+from tetrimino import Tetrimino
+from config import piece_mode, piece_buffer_size
+
+
+class PieceSource:
+    """ テトリミノの生成元を管理するクラス
+
+    シードを指定した乱数でテトリミノのタイプ列を先にまとめて生成(バッファ)しておき、
+    順番に払い出す。同じシードの PieceSource は同じ順番でテトリミノを生成するので、
+    同じ世代の全個体に同じテトリミノ列でPlayさせることができる
+
+    mode:
+    ・'uniform' = 毎回7種類から一様に選ぶ
+    ・'bag' = 7種類を1セットとしてシャッフルした順に出す(7-bag)
+    """
+
+    def __init__(self, seed=None, mode=piece_mode, buffer_size=piece_buffer_size):
+        """ イニシャライザ
+
+        :param seed: 乱数シード (None の場合は再現性なし)
+        :param mode: 'uniform' または 'bag'
+        :param buffer_size: 1回にまとめて生成するテトリミノの数
+        """
+        if mode not in ('uniform', 'bag'):
+            raise ValueError("unknown piece mode: {}".format(mode))
+        self.seed = seed
+        self.mode = mode
+        self.buffer_size = buffer_size
+        self.reset()
+
+    def reset(self):
+        """ 最初のテトリミノから生成し直す
+
+        :return:
+        """
+        self.rng = random.Random(self.seed)
+        self.buffer = []
+        self.pos = 0
+        self.count = 0
+
+    def fill(self, n):
+        """ 少なくとも n 個のテトリミノがバッファに残っている状態にする
+
+        :param n: 必要な個数
+        :return:
+        """
+        while len(self.buffer) - self.pos < n:
+            if self.mode == 'bag':
+                types = []
+                while len(types) < self.buffer_size:
+                    bag = list(range(7))
+                    self.rng.shuffle(bag)
+                    types += bag
+            else:
+                types = [self.rng.randrange(0, 7) for _ in range(self.buffer_size)]
+            self.buffer = self.buffer[self.pos:] + types
+            self.pos = 0
+
+    def peek(self, n=1):
+        """ 次に生成されるテトリミノのタイプを(払い出さずに)返す
+
+        :param n: 先読みする個数
+        :return: タイプの配列
+        """
+        self.fill(n)
+        return self.buffer[self.pos:self.pos + n]
+
+    def next_type(self):
+        """ 次のテトリミノのタイプを払い出す
+
+        :return: タイプ
+        """
+        self.fill(1)
+        t = self.buffer[self.pos]
+        self.pos += 1
+        self.count += 1
+        return t
+
+    def next(self):
+        """ 次のテトリミノを生成する
+
+        :return: 初期位置の Tetrimino インスタンス
+        """
+        return Tetrimino(5, 2, 0, self.next_type())
@@ -1,10 +1,13 @@
+import os
 import pygame
 import sys
-import random
 from field import Field
-from tetrimino import Tetrimino
+from piece_source import PieceSource
 from config import BLOCK_SIZE, BLOCK_IMG_SIZE
 
+# ブロック画像 (実行時のカレントディレクトリによらずこのファイルと同じディレクトリから読み込む)
+TILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tile.png")
+
 
 def make_colors():
     """7色のブロックをそれぞれ抽出する関数
@@ -13,7 +16,7 @@ def make_colors():
     :return: 7色のブロック画像配列 (pygame.Surface オブジェクト)
     """
     colors = []
-    image = pygame.image.load("./tile.png")
+    image = pygame.image.load(TILE_PATH)
     for i in range(7):
         tmp_color_surface = pygame.Surface((BLOCK_IMG_SIZE, BLOCK_IMG_SIZE))
         color_surface = pygame.Surface((BLOCK_SIZE, BLOCK_SIZE))
@@ -23,21 +26,15 @@ def make_colors():
     return colors
 
 
-def generate_tetrimino():
-    """テトリミノをランダムに1つ生成する関数
-
-    :return: ランダムに生成されたTetrimino インスタンス
-    """
-    random.seed()
-    return Tetrimino(5, 2, 0, random.randrange(0, 7))
-
-
-def play():
+def play(source=None):
     """ Play関数
 
     キーボード操作でテトリスを遊べる関数
+    :param source: テトリミノの生成元 (PieceSource). 省略時は再現性なし
     :return:
     """
+    if source is None:
+        source = PieceSource()
     pygame.init()  # pygameを初期化数する
     screen = pygame.display.set_mode((640, 480))  # 画面サイズを640, 480に
     pygame.display.set_caption("tetris_ai")
@@ -51,7 +48,7 @@ def play():
     field = Field()
 
     # 1つめ(初期)のTetrimino(mino)
-    mino = generate_tetrimino()
+    mino = source.next()
 
     # minoの落下が確定して次のminoを生成する必要がある場合にTrueとする
     generate_flag = False
@@ -119,7 +116,7 @@ def play():
             mino = next_mino  # 盤面との接触が無いので下に1つ移動を確定する
 
         if generate_flag:
-            mino = generate_tetrimino()
+            mino = source.next()
             if mino.collision(field):
                 print("GAME OVER")
                 game_over_flag = True
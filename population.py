@@ -1,77 +1,90 @@
 import numpy as np
-import torch
-from network import Network
-from config import input_size, elitism_pct, mutation_prob, weights_mutate_power, device
+from network import create_network
+from config import input_size, elitism_pct, mutation_prob, weights_mutate_power, weights_init_min, weights_init_max
 
 
 class Population:
     """ 遺伝的アルゴリズムの各世代を管理するクラス
+
+    各個体のモデルのウエイトを (個体数 x input_size) の1つの配列で保持し、
+    選択・交叉・突然変異を配列全体の演算で行う
     """
 
-    def __init__(self, size=50, old_population=None):
+    def __init__(self, size=50, old_population=None, rng=None):
         """ イニシャライザ
 
         :param size: 各世代の個体数
         :param old_population: (次世代を生成する場合には前世代のPopulationを与える)
+        :param rng: 乱数生成器(numpy.random.Generator). 次世代を生成する場合は前世代のものを引き継ぐ
         """
         self.size = size
         if old_population is None:
-            # 前世代なしの場合は、個体数全て初期値でモデルを生成する
-            self.models = [Network() for i in range(size)]
+            # 前世代なしの場合は、個体数全て一様分布の初期値でウエイトを生成する
+            self.rng = rng if rng is not None else np.random.default_rng()
+            self.weights = self.rng.uniform(weights_init_min, weights_init_max,
+                                            (size, input_size)).astype(np.float32)
         else:
             # 前世代が与えられた場合は交叉(crossover),突然変異(mutate)を行い次世代を生成する
-            self.old_models = old_population.models
+            self.rng = old_population.rng
+            self.old_weights = old_population.weights
             self.old_fitnesses = old_population.fitnesses
-            self.models = []
             self.crossover()
             self.mutate()
         # 各個体の評価値を保存する配列を初期化
         self.fitnesses = np.zeros(self.size)
 
+    @property
+    def n_elites(self):
+        """ 交叉・突然変異を行わずにそのまま次世代に残す優秀な個体の数
+
+        :return: 個体数
+        """
+        return int(np.ceil(self.size * elitism_pct))
+
+    def get_model(self, i):
+        """ 個体のモデルを返す
+
+        :param i: 個体番号
+        :return: モデル (Network または TorchNetwork)
+        """
+        return create_network(self.weights[i])
+
     def crossover(self):
         """ 交叉(crossover)
         :return:
         """
         # 全ての個体の評価値の合計および各個体評価値を正規化
-        sum_fitnesses = np.sum(self.old_fitnesses)
-        probs = [self.old_fitnesses[i] / sum_fitnesses for i in
-                 range(self.size)]
+        probs = self.old_fitnesses / np.sum(self.old_fitnesses)
+        if np.count_nonzero(probs) < 2:
+            raise ValueError("at least two individuals need a positive fitness")
 
+        # 優秀な個体は(上位20%)はそのまま
         sort_indices = np.argsort(probs)[::-1]
-        for i in range(self.size):
-            if i < self.size * elitism_pct:
-                # 優秀な個体は(上位20%)はそのまま
-                model_c = self.old_models[sort_indices[i]]
-            else:
-                # それ以外はランダムな2つの個体をかけ合わせる
-                a, b = np.random.choice(self.size, size=2, p=probs,
-                                        replace=False)
-                prob_neuron_from_a = 0.5
-
-                # モデルの各ウエイトを50/50の確率で交叉
-                model_a, model_b = self.old_models[a], self.old_models[b]
-                model_c = Network()
-
-                for j in range(input_size):
-                    if np.random.random() > prob_neuron_from_a:
-                        model_c.output.weight.data[0][j] = \
-                            model_b.output.weight.data[0][j]
-                    else:
-                        model_c.output.weight.data[0][j] = \
-                            model_a.output.weight.data[0][j]
-
-            self.models.append(model_c)
+        elites = self.old_weights[sort_indices[:self.n_elites]]
+
+        # それ以外は評価値に比例した確率で選んだ異なる2つの個体をかけ合わせる
+        n_children = self.size - self.n_elites
+        a = self.rng.choice(self.size, size=n_children, p=probs)
+        b = self.rng.choice(self.size, size=n_children, p=probs)
+        same = a == b
+        while same.any():
+            b[same] = self.rng.choice(self.size, size=np.count_nonzero(same), p=probs)
+            same = a == b
+
+        # モデルの各ウエイトを50/50の確率で交叉
+        from_b = self.rng.random((n_children, input_size)) > 0.5
+        children = np.where(from_b, self.old_weights[b], self.old_weights[a])
+
+        self.weights = np.concatenate((elites, children)).astype(np.float32)
 
     def mutate(self):
         """ 突然変異(mutate)
+
+        優秀な個体(交叉せずにそのまま残した個体)以外の各ウエイトに
+        一定の確率(20%)で一定のノイズを加える
         :return:
         """
-        for model in self.models:
-            for i in range(input_size):
-                # 一定の確率(20%)で突然変異を行ったモデルとする
-                if np.random.random() < mutation_prob:
-                    # 一定のノイズをモデルに加える
-                    with torch.no_grad():
-                        noise = torch.randn(1).mul_(
-                            weights_mutate_power).to(device)
-                        model.output.weight.data[0][i].add_(noise[0])
\ No newline at end of file
+        children = self.weights[self.n_elites:]
+        mutated = self.rng.random(children.shape) < mutation_prob
+        noise = self.rng.standard_normal(children.shape) * weights_mutate_power
+        children += np.where(mutated, noise, 0).astype(np.float32)
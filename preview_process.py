@@ -0,0 +1,94 @@
+import multiprocessing
+from network import create_network
+from piece_source import PieceSource
+
+
+def receive_latest(connection):
+    """ 届いているもののうち最新のものを受け取る (届いていなければ届くまで待つ)
+
+    :param connection: multiprocessing.Pipe の接続
+    :return: 最新の送られたもの
+    """
+    item = connection.recv()
+    while connection.poll():
+        item = connection.recv()
+    return item
+
+
+def preview_worker(connection):
+    """ プレビュー用プロセスの処理
+
+    受け取ったウエイトのモデルでゲームを描画しながらPlayし、平均スコアを送り返す
+    Play中に新しいウエイトが届いたらそのゲームを止めて、最新のウエイトに切り替える
+    ウィンドウが閉じられたら終了する
+
+    :param connection: (世代数, ウエイト, 各Playの乱数シード) を受け取り (None で終了)、
+                       (世代数, 平均スコア, 平均消去ライン数) を送る multiprocessing.Pipe の接続
+    :return:
+    """
+    # main は学習側のプロセスで読み込まれているので、こちらのプロセスで必要になってから読み込む
+    from main import preview_ai
+    from renderer import get_renderer
+
+    request = receive_latest(connection)
+    while request is not None:
+        iteration, weights, seeds = request
+        model = create_network(weights)
+        score = 0
+        lines = 0
+        for s in seeds:
+            result = preview_ai(model, PieceSource(s), stop=connection.poll)
+            if get_renderer() is None:
+                return
+            score += result[0]
+            lines += result[1]
+            if connection.poll():
+                break
+        else:
+            print("preview {}: score: {} line: {}".format(iteration, score / len(seeds), lines / len(seeds)))
+            connection.send((iteration, score / len(seeds), lines / len(seeds)))
+        request = receive_latest(connection)
+
+
+class PreviewProcess:
+    """ 学習と並行して別プロセスでプレビューを描画するクラス
+
+    ウエイトと結果は multiprocessing.Pipe でやり取りし、受け取る側は届いているもののうち最新のものだけを使う
+    (プレビュー側が受け取る前に次のウエイトを送った場合は古い方が捨てられる)
+    学習側は送る・結果を受け取るどちらも待たない
+    プレビュー用プロセスは daemon なので学習側のプロセスが終了すると一緒に終了する
+    """
+
+    def __init__(self):
+        """ イニシャライザ (プレビュー用プロセスを起動する)
+        """
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=preview_worker, args=(child_connection,), daemon=True)
+        self.process.start()
+        self.last = None
+
+    def send(self, iteration, weights, seeds):
+        """ プレビューするモデルのウエイトを送る (待たない)
+
+        :param iteration: 世代数
+        :param weights: ウエイト
+        :param seeds: 各Playの乱数シード
+        :return:
+        """
+        try:
+            self.connection.send((iteration, weights, seeds))
+        except OSError:
+            # ウィンドウが閉じられてプレビュー用プロセスが終了している
+            pass
+
+    def poll(self):
+        """ 届いているプレビューの結果のうち最新のものを返す (待たない)
+
+        :return: (世代数, 平均スコア, 平均消去ライン数) (まだ結果が無い場合は None)
+        """
+        try:
+            while self.connection.poll():
+                self.last = self.connection.recv()
+        except (EOFError, OSError):
+            pass
+        return self.last
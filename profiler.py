@@ -0,0 +1,113 @@
+import functools
+import json
+import random
+import time
+import numpy as np
+from config import profiling
+
+
+# 処理ごとの計測結果 {処理名: [呼び出し回数, 合計時間(秒), 時間のサンプル]}
+stats = {}
+
+# パーセンタイル計算用に処理ごとに保持する時間のサンプル数の上限
+MAX_SAMPLES = 10000
+
+sampler = random.Random(0)
+
+
+def timed(name):
+    """ 関数の呼び出し回数と時間を計測するデコレータ
+
+    config.profiling が False の場合は関数をそのまま返すので計測しない場合のオーバーヘッドは無い
+
+    :param name: 処理名
+    :return: デコレータ
+    """
+    def decorator(func):
+        if not profiling:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def record(name, elapsed):
+    """ 1回分の時間を記録する
+
+    サンプルは MAX_SAMPLES 個まで、それを超えたら一様にサンプリングして入れ替える(リザーバサンプリング)
+
+    :param name: 処理名
+    :param elapsed: 時間(秒)
+    :return:
+    """
+    stat = stats.get(name)
+    if stat is None:
+        stat = stats[name] = [0, 0.0, []]
+    stat[0] += 1
+    stat[1] += elapsed
+    samples = stat[2]
+    if len(samples) < MAX_SAMPLES:
+        samples.append(elapsed)
+    else:
+        i = sampler.randrange(stat[0])
+        if i < MAX_SAMPLES:
+            samples[i] = elapsed
+
+
+def merge(other):
+    """ 他のプロセスで計測した結果(pop_stats の戻り値)を合算する
+
+    :param other: 計測結果
+    :return:
+    """
+    for name, (count, total, samples) in other.items():
+        stat = stats.get(name)
+        if stat is None:
+            stats[name] = [count, total, list(samples[:MAX_SAMPLES])]
+            continue
+        stat[0] += count
+        stat[1] += total
+        stat[2] = stat[2] + samples
+        if len(stat[2]) > MAX_SAMPLES:
+            stat[2] = sampler.sample(stat[2], MAX_SAMPLES)
+
+
+def pop_stats():
+    """ 計測結果を返して、計測結果をクリアする
+
+    :return: 計測結果
+    """
+    result = dict(stats)
+    stats.clear()
+    return result
+
+
+def summary():
+    """ 処理ごとの計測結果の集計を返す
+
+    :return: {処理名: {calls, total_s, mean_us, p50_us, p90_us, p99_us, max_us}}
+    """
+    result = {}
+    for name, (count, total, samples) in stats.items():
+        p50, p90, p99, p100 = np.percentile(samples, [50, 90, 99, 100]) * 1e6
+        result[name] = {'calls': count, 'total_s': total, 'mean_us': total / count * 1e6,
+                        'p50_us': p50, 'p90_us': p90, 'p99_us': p99, 'max_us': p100}
+    return result
+
+
+def write_log(path, record_dict):
+    """ 1行分の結果をJSON-lines形式で追記する
+
+    :param path: ログファイル名
+    :param record_dict: 書き出す dict
+    :return:
+    """
+    with open(path, "a") as f:
+        f.write(json.dumps(record_dict, default=float) + "\n")
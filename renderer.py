@@ -0,0 +1,143 @@
+import pygame
+from play import make_colors
+from config import BLOCK_SIZE
+
+
+class Renderer:
+    """ プレビュー・リプレイの描画を管理するクラス
+
+    pygame の初期化、ウィンドウ、フォント、ブロック画像の読み込みは最初の1回だけ行い、
+    壁と空きマスの枠線はあらかじめ背景の Surface に描画しておく
+    前回描画した各行の内容を保持しておき、変わった行(set_blocks / line_erase で変わった行と
+    前回テトリミノを描画した行)とテキストだけを描画し直して、その矩形だけを画面に反映する
+    """
+
+    WIDTH = 12
+    HEIGHT = 21     # 床を含む
+    TEXT_COLOR = (255, 255, 255)
+    GRID_COLOR = (80, 80, 80)
+
+    def __init__(self, caption="tetris_ai", size=(640, 480), font_size=40):
+        """ イニシャライザ (ウィンドウを開く)
+
+        :param caption: ウィンドウのタイトル
+        :param size: ウィンドウのサイズ
+        :param font_size: テキストのフォントサイズ
+        """
+        pygame.init()
+        self.screen = pygame.display.set_mode(size)
+        pygame.display.set_caption(caption)
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.SysFont("Arial", font_size)
+        self.colors = make_colors()
+        self.background = self.make_background(size)
+        self.lines = [None] * self.HEIGHT   # 前回描画した各行の内容
+        self.mino_rows = set()              # 前回テトリミノを描画した行
+        self.texts = {}                     # 位置: (前回描画したテキスト, 描画した矩形)
+        self.dirty = []                     # 次の update で画面に反映する矩形
+        self.closed = False
+        self.screen.blit(self.background, (0, 0))
+        pygame.display.flip()
+
+    def make_background(self, size):
+        """ 空の盤面 (壁・床と空きマスの枠線) を描画した背景の Surface を生成する
+
+        :param size: ウィンドウのサイズ
+        :return: pygame.Surface
+        """
+        background = pygame.Surface(size)
+        background.fill((0, 0, 0))
+        for y in range(self.HEIGHT):
+            for x in range(self.WIDTH):
+                wall = x == 0 or x == self.WIDTH - 1 or y == self.HEIGHT - 1
+                rect = (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+                pygame.draw.rect(background, self.GRID_COLOR, rect, 0 if wall else 1)
+        return background
+
+    def draw_field(self, field):
+        """ 盤面を描画する (前回から変わった行だけ)
+
+        :param field: 盤面 (Field / BitField. ブロック色を保持しているもの)
+        :return:
+        """
+        for y in range(self.HEIGHT):
+            line = field.get_line(y)
+            if line == self.lines[y] and y not in self.mino_rows:
+                continue
+            self.lines[y] = line
+            rect = pygame.Rect(0, y * BLOCK_SIZE, self.WIDTH * BLOCK_SIZE, BLOCK_SIZE)
+            self.screen.blit(self.background, rect, rect)
+            for x, c in enumerate(line):
+                if 0 <= c < len(self.colors):
+                    self.screen.blit(self.colors[c], (x * BLOCK_SIZE, y * BLOCK_SIZE))
+            self.dirty.append(rect)
+        self.mino_rows = set()
+
+    def draw_mino(self, mino):
+        """ 落下中のテトリミノを描画する (次の draw_field でその行は描画し直す)
+
+        :param mino: Tetrimino
+        :return:
+        """
+        for x, y, c in mino.get_blocks():
+            self.screen.blit(self.colors[c], (x * BLOCK_SIZE, y * BLOCK_SIZE))
+            self.dirty.append(pygame.Rect(x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
+            self.mino_rows.add(y)
+
+    def draw_text(self, text, pos):
+        """ テキストを描画する (前回から変わった場合だけ)
+
+        :param text: 文字列
+        :param pos: 位置 (x, y)
+        :return:
+        """
+        last = self.texts.get(pos)
+        if last is not None and last[0] == text:
+            return
+        if last is not None:
+            self.screen.blit(self.background, last[1], last[1])
+            self.dirty.append(last[1])
+        rect = self.screen.blit(self.font.render(text, True, self.TEXT_COLOR), pos)
+        self.texts[pos] = (text, rect)
+        self.dirty.append(rect)
+
+    def update(self, speed=30):
+        """ 描画した矩形を画面に反映し、イベントを処理する
+
+        :param speed: 1秒あたりのフレーム数 (0 = 上限なし(早送り))
+        :return: QUIT 以外のイベントの配列 (ウィンドウが閉じられた場合は None)
+        """
+        pygame.display.update(self.dirty)
+        self.dirty = []
+        events = []
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.close()
+                return None
+            events.append(event)
+        if speed:
+            self.clock.tick(speed)
+        return events
+
+    def close(self):
+        """ ウィンドウを閉じる
+
+        :return:
+        """
+        self.closed = True
+        pygame.quit()
+
+
+# get_renderer で生成するウィンドウ (プロセスごとに1つ)
+renderer = None
+
+
+def get_renderer():
+    """ 共有のウィンドウを返す (最初に呼ばれた時に生成する)
+
+    :return: Renderer (ウィンドウが閉じられた後は None)
+    """
+    global renderer
+    if renderer is None:
+        renderer = Renderer()
+    return None if renderer.closed else renderer
@@ -0,0 +1,237 @@
+import argparse
+import os
+import struct
+import tempfile
+import numpy as np
+from bitfield import BitField
+from tetrimino import Tetrimino, MINO_TABLE
+from search import get_drop
+from config import replay_dir, preview_speed
+
+# ファイルの先頭: マジックナンバー, バージョン, ゲームの乱数シード (None の場合は NO_SEED)
+HEADER = struct.Struct('<4sBQ')
+MAGIC = b'TRPL'
+VERSION = 1
+NO_SEED = 2**64 - 1
+
+# 1手を2バイトで表す: bit 0-2 = タイプ, bit 3-4 = 回転, bit 5-8 = 位置 x + 2
+MOVE = np.dtype('<u2')
+FLUSH_MOVES = 4096          # この手数ごとにファイルに書き出す
+KEYFRAME_INTERVAL = 256     # 再生時にこの手数ごとの盤面を保持しておく (シーク用)
+
+
+def encode_move(mino):
+    """ 落下位置のテトリミノを2バイトの値にする
+
+    落下後の y 座標は盤面から計算できるので保存しない
+
+    :param mino: 落下後の Tetrimino
+    :return: 整数
+    """
+    return mino.t | (mino.r % 4) << 3 | (mino.x + 2) << 5
+
+
+def decode_move(move):
+    """ encode_move の値から (タイプ, 回転, 位置 x) を返す
+
+    :param move: 整数
+    :return: (タイプ, 回転, 位置 x)
+    """
+    move = int(move)
+    return move & 7, (move >> 3) & 3, ((move >> 5) & 15) - 2
+
+
+def replay_path(key, seed):
+    """ 個体とゲームの乱数シードからリプレイのファイル名を返す
+
+    :param key: fitness_store.weights_key の値
+    :param seed: ゲームの乱数シード
+    :return: ファイル名
+    """
+    return os.path.join(replay_dir, "{:016x}_{}.replay".format(key, seed))
+
+
+class ReplayWriter:
+    """ 1ゲームの各手を記録するクラス
+
+    手は FLUSH_MOVES 手ごとにまとめてファイルに書き出すので、長いゲームでもメモリは一定
+    ファイルは最初に書き出す時に開くので、書き出すまではファイルを開いたままにしない
+    同じ個体・シードのゲームを同時に記録してもよいように、一時ファイルは記録ごとに別の名前にする
+    """
+
+    def __init__(self, path, seed):
+        """ イニシャライザ
+
+        :param path: ファイル名
+        :param seed: ゲームの乱数シード
+        """
+        self.path = path
+        self.seed = seed
+        self.tmp_path = None
+        self.moves = []
+
+    def append(self, mino):
+        """ 1手を記録する
+
+        :param mino: 落下後の Tetrimino
+        :return:
+        """
+        self.moves.append(encode_move(mino))
+        if len(self.moves) >= FLUSH_MOVES:
+            self.flush()
+
+    def flush(self):
+        """ 記録した手を一時ファイルに書き出す (最初に書き出す時に一時ファイルを作成してヘッダを書き込む)
+
+        :return:
+        """
+        if self.tmp_path is None:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, self.tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp",
+                                                 dir=directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, NO_SEED if self.seed is None else self.seed))
+        with open(self.tmp_path, "ab") as f:
+            f.write(np.array(self.moves, dtype=MOVE).tobytes())
+        self.moves = []
+
+    def close(self):
+        """ 残りの手を書き出してファイル名を置き換える (途中で止まった場合は .tmp のまま残る)
+
+        同じファイル名のリプレイが既にある場合(同じ個体・シードのゲーム)は置き換える (内容は同じ)
+
+        :return:
+        """
+        self.flush()
+        os.replace(self.tmp_path, self.path)
+
+
+def prune_replays(keep_keys):
+    """ 指定した個体以外のリプレイを削除する
+
+    :param keep_keys: 残す個体の weights_key の値の集合
+    :return:
+    """
+    if not os.path.isdir(replay_dir):
+        return
+    for name in os.listdir(replay_dir):
+        if name.endswith(".replay") and int(name.split("_")[0], 16) not in keep_keys:
+            os.remove(os.path.join(replay_dir, name))
+
+
+class Replay:
+    """ 記録したゲームを再生するクラス
+
+    モデルを使わずに記録した手を順に盤面に置いていくだけで任意の手の盤面を再現する
+    KEYFRAME_INTERVAL 手ごとの盤面を保持しておき、シークはそこから進める
+    """
+
+    def __init__(self, path):
+        """ イニシャライザ
+
+        :param path: ReplayWriter で記録したファイル名
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, seed = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a replay file: {}".format(path))
+        self.seed = None if seed == NO_SEED else seed
+        self.moves = np.frombuffer(data, dtype=MOVE, offset=HEADER.size)
+        self.keyframes = {0: (BitField(), 0, 0)}
+
+    def __len__(self):
+        """ 記録した手数
+
+        :return: 手数
+        """
+        return len(self.moves)
+
+    def get_mino(self, field, n):
+        """ n 手目のテトリミノの落下後の位置を返す
+
+        :param field: n 手目を置く前の盤面
+        :param n: 手の番号
+        :return: 落下後の Tetrimino
+        """
+        t, r, x = decode_move(self.moves[n])
+        shape = MINO_TABLE[t][r]
+        drop = get_drop(field, shape, x, 2, field.get_column_tops())
+        return Tetrimino(x, 2 + drop, r, t, drop)
+
+    def seek(self, n):
+        """ n 手目を置く前の状態を返す
+
+        :param n: 手の番号 (0 - len(self))
+        :return: (盤面, スコア, 消去ライン数). 盤面は複製なので書き換えてよい
+        """
+        start = min(n // KEYFRAME_INTERVAL * KEYFRAME_INTERVAL, max(self.keyframes))
+        field, score, lines = self.keyframes[start]
+        field = field.copy()
+        for i in range(start, n):
+            mino = self.get_mino(field, i)
+            field.set_blocks(mino.get_blocks())
+            lines += field.line_erase()
+            score += mino.get_score()
+            if (i + 1) % KEYFRAME_INTERVAL == 0:
+                self.keyframes[i + 1] = (field.copy(), score, lines)
+        return field, score, lines
+
+
+def play_replay(path, speed=preview_speed, start=0):
+    """ 記録したゲームを描画して再生する
+
+    キー操作: スペース = 一時停止, ←/→ = 1手戻る/進む, PageUp/PageDown = 100手戻る/進む, ↑/↓ = 速度を2倍/半分
+
+    :param path: リプレイのファイル名
+    :param speed: 1秒あたりの手数 (0 = 上限なし(早送り))
+    :param start: 再生を始める手の番号
+    :return:
+    """
+    import pygame
+    from renderer import Renderer
+
+    replay = Replay(path)
+    renderer = Renderer("tetris_ai replay", font_size=20)
+    step = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1, pygame.K_PAGEUP: -100, pygame.K_PAGEDOWN: 100}
+
+    n = min(start, len(replay))
+    field, score, lines = replay.seek(n)
+    paused = False
+    while True:
+        renderer.draw_text("move: {} / {}".format(n, len(replay)), (300, 50))
+        renderer.draw_text("score: {}".format(score), (300, 100))
+        renderer.draw_text("erase: {}".format(lines), (300, 150))
+        renderer.draw_field(field)
+        events = renderer.update(speed)
+        if events is None:
+            return
+        for event in events:
+            if event.type != pygame.KEYDOWN:
+                continue
+            if event.key == pygame.K_SPACE:
+                paused = not paused
+            elif event.key in step:
+                n = max(0, min(len(replay), n + step[event.key]))
+                field, score, lines = replay.seek(n)
+            elif event.key == pygame.K_UP:
+                speed = speed * 2 if speed else 0
+            elif event.key == pygame.K_DOWN:
+                speed = max(1, speed // 2) if speed else 64
+
+        if not paused and n < len(replay):
+            mino = replay.get_mino(field, n)
+            field.set_blocks(mino.get_blocks())
+            lines += field.line_erase()
+            score += mino.get_score()
+            n += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="記録したゲームを再生する")
+    parser.add_argument("path", help="リプレイのファイル名")
+    parser.add_argument("--speed", type=int, default=preview_speed, help="1秒あたりの手数 (0 = 上限なし)")
+    parser.add_argument("--start", type=int, default=0, help="再生を始める手の番号")
+    args = parser.parse_args()
+    play_replay(args.path, args.speed, args.start)
@@ -0,0 +1,231 @@
+import time
+import numpy as np
+from tetrimino import Tetrimino, MINO_TABLE, ROTATIONS
+from feature_cache import shared_cache
+from profiler import timed
+from config import beam_width, lookahead_budget
+
+
+@timed('get_candidate_list')
+def get_candidate_list(init_mino, field):
+    """ 盤面の状況を踏まえて落下可能なテトリミノ候補をすべて返す
+
+    :param init_mino: 与えられたテトリミノ
+    :param field: 盤面
+    :return: 落下可能な位置にあるテトリミノ配列 (落下の高さに応じてscore値をセットする)
+    """
+    # コンパイル済みの探索を持つ盤面 (JitField) はそちらを使う
+    if hasattr(field, 'get_placements'):
+        return field.get_placements(init_mino)
+
+    candidate = []
+    mino_type = init_mino.get_type()
+    tops = field.get_column_tops()
+
+    # タイプによって回転のバリエーションが1, 2 or 4 となる
+    # (Tetriminoを生成せずに回転済みの形(MinoShape)と座標だけで探索する)
+    for i in range(ROTATIONS[mino_type]):
+        r = init_mino.r + i
+        shape = MINO_TABLE[mino_type][r % 4]
+        x, y = init_mino.x, init_mino.y
+
+        # まずは最も左に寄せる
+        while not field.collision(shape, x - 1, y):
+            x -= 1
+
+        while True:
+            # 可能なところまで落下させる
+            score = get_drop(field, shape, x, y, tops)
+            candidate.append(Tetrimino(x, y + score, r, mino_type, score))
+
+            # １つづつ右に移動させる
+            if field.collision(shape, x + 1, y):
+                break
+            x += 1
+    return candidate
+
+
+def get_drop(field, shape, x, y, tops):
+    """ テトリミノを落下させた場合の落下量を求める
+
+    各列の最も上のブロックの位置とテトリミノの列ごとの最も下のブロックの位置から直接計算する
+    テトリミノが既に最も上のブロックより下にある列がある場合(上に張り出したブロックがある場合)は
+    1段づつ当たり判定を行って落下させる
+
+    :param field: 盤面
+    :param shape: テトリミノの形 (MinoShape)
+    :param x: 落下前の位置 x
+    :param y: 落下前の位置 y
+    :param tops: field.get_column_tops() の値
+    :return: 落下量(落下後の位置 y - 落下前の位置 y)
+    """
+    drops = []
+    for i, bottom in enumerate(shape.bottom):
+        top = tops[x + shape.min_x + i]
+        if y + bottom >= top:
+            break
+        drops.append(top - 1 - bottom - y)
+    else:
+        return min(drops)
+
+    drop = 0
+    while not field.collision(shape, x, y + drop + 1):
+        drop += 1
+    return drop
+
+
+class SearchStats:
+    """ 先読み探索の統計情報 (展開したノード数と1手あたりの時間) を集計するクラス
+
+    ノード数は評価した盤面(1手目の候補 + 2手目の候補)の数
+    """
+
+    def __init__(self):
+        """ イニシャライザ
+        """
+        self.clear()
+
+    def record(self, nodes, elapsed, truncated):
+        """ 1手分の探索結果を記録する
+
+        :param nodes: 評価した盤面の数
+        :param elapsed: 時間(秒)
+        :param truncated: 時間の上限で展開を打ち切った場合は True
+        :return:
+        """
+        self.moves += 1
+        self.nodes += nodes
+        self.elapsed += elapsed
+        self.truncated += truncated
+
+    def merge(self, other):
+        """ 他のプロセスで集計した結果 (pop の戻り値) を合算する
+
+        :param other: (手数, ノード数, 時間, 打ち切った手数)
+        :return:
+        """
+        self.moves += other[0]
+        self.nodes += other[1]
+        self.elapsed += other[2]
+        self.truncated += other[3]
+
+    def pop(self):
+        """ 集計結果を返して、集計結果をクリアする
+
+        :return: (手数, ノード数, 時間, 打ち切った手数)
+        """
+        result = (self.moves, self.nodes, self.elapsed, self.truncated)
+        self.clear()
+        return result
+
+    def summary(self):
+        """ 1手あたりの集計結果を返す
+
+        :return: dict (moves, nodes_per_move, ms_per_move, truncated_pct)
+        """
+        moves = max(self.moves, 1)
+        return {'moves': self.moves, 'nodes_per_move': self.nodes / moves,
+                'ms_per_move': self.elapsed / moves * 1e3, 'truncated_pct': self.truncated / moves * 100}
+
+    def clear(self):
+        """ 集計結果をクリアする
+
+        :return:
+        """
+        self.moves = 0
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.truncated = 0
+
+
+# get_next_lookahead の集計結果 (プロセスごとに1つ)
+search_stats = SearchStats()
+
+
+def get_next(model, mino, field, cache=shared_cache, next_type=None):
+    """ モデルと盤面から与えれたテトリミノが落下位置を計算する
+
+    :param model: モデル
+    :param mino:  移動対象のテトリミノ
+    :param field: 現在の盤面
+    :param cache: 盤面評価値のキャッシュ (FeatureCache)
+    :param next_type: 次のテトリミノのタイプ. 与えた場合は get_next_lookahead で先読みして決める
+    :return: 落下後の盤面のスコアが最も高いテトリミノ(落下後位置)
+    """
+    if next_type is not None:
+        return get_next_lookahead(model, mino, field, next_type, cache=cache)
+
+    # 回転や左右移動を行って落下可能な候補を全て計算する
+    candidate_mino = get_candidate_list(mino, field)
+    # 各落下候補において落下後の盤面の評価を行い(候補数 x 9)の行列にまとめる
+    field_scores = np.array([cache.get_field_score(field, m.get_blocks()) for m in candidate_mino])
+    # 1回のモデル評価で最もスコア値の高い落下位置を求めて戻す
+    best, _ = model.select(field_scores)
+    return candidate_mino[best]
+
+
+@timed('get_next_lookahead')
+def get_next_lookahead(model, mino, field, next_type, width=beam_width, budget=lookahead_budget,
+                       cache=shared_cache, stats=search_stats):
+    """ 次のテトリミノまで先読みして落下位置を計算する (2手の探索)
+
+    1手目の全候補をモデルで評価し、評価値の上位 width 個だけ(ビーム)を実際に置いて行を消した盤面を作り、
+    次のテトリミノの全候補の評価値の最大値をその1手目の評価値とする
+    ・行を消した後に同じ盤面になる1手目の候補は1回だけ展開する
+    ・2手目の候補の盤面評価値は全てまとめて1回のモデル評価で計算する
+    ・budget 秒を超えたらそれ以降の候補は展開せず、展開した候補の中から選ぶ
+      (1手目の評価値が高い順に展開するので、打ち切っても最も有望な候補は評価済み)
+
+    :param model: モデル
+    :param mino: 移動対象のテトリミノ
+    :param field: 現在の盤面
+    :param next_type: 次のテトリミノのタイプ (PieceSource.peek で得る)
+    :param width: 展開する1手目の候補数
+    :param budget: 1手あたりの時間の上限(秒) (None = 上限なし)
+    :param cache: 盤面評価値のキャッシュ (FeatureCache)
+    :param stats: 集計先 (SearchStats)
+    :return: 2手後の盤面のスコアが最も高くなる1手目のテトリミノ(落下後位置)
+    """
+    start = time.perf_counter()
+    candidate_mino = get_candidate_list(mino, field)
+    field_scores = np.array([cache.get_field_score(field, m.get_blocks()) for m in candidate_mino])
+    values = np.asarray(model.activate_batch(field_scores))
+    nodes = len(candidate_mino)
+
+    # 1手目の評価値が高い順に展開する (同じ評価値の場合は get_next と同じく先の候補を優先)
+    beam = np.argsort(-values, kind='stable')[:width]
+    next_mino = Tetrimino(5, 2, 0, next_type)
+    expanded = []       # 展開した1手目の候補の番号
+    children = {}       # 行を消した後の盤面キー: 2手目の候補の盤面評価値の範囲 (展開済みの盤面を再利用する)
+    features = []
+    truncated = False
+    for i in beam:
+        if budget is not None and expanded and time.perf_counter() - start > budget:
+            truncated = True
+            break
+        child = field.copy()
+        child.set_blocks(candidate_mino[i].get_blocks())
+        child.line_erase()
+        key = child.get_board_key()
+        if key not in children:
+            if next_mino.collision(child):
+                # 次のテトリミノが置けない(ゲームオーバーになる)
+                children[key] = None
+            else:
+                next_candidates = get_candidate_list(next_mino, child)
+                children[key] = (len(features), len(features) + len(next_candidates))
+                features += [cache.get_field_score(child, m.get_blocks()) for m in next_candidates]
+                nodes += len(next_candidates)
+        expanded.append((i, key))
+
+    # 全ての2手目の候補を1回でモデル評価し、1手目の候補ごとに最大値をとる
+    next_values = np.asarray(model.activate_batch(np.array(features))) if features else np.zeros(0)
+    best, best_value = None, -np.inf
+    for i, key in expanded:
+        span = children[key]
+        value = next_values[span[0]:span[1]].max() if span is not None else -np.inf
+        if best is None or value > best_value:
+            best, best_value = i, value
+
+    stats.record(nodes, time.perf_counter() - start, truncated)
+    return candidate_mino[best]
@@ -1,4 +1,52 @@
-from block import Block
+from collections import namedtuple
+from config import BLOCK_SIZE
+
+
+# 各テトリミノの回転前のブロック配置 (中心からの相対座標)
+SHAPES = [
+    [(-1, -1), (-1, 0), (0, 0), (0, -1)],   # O(四角)
+    [(-2, 0), (-1, 0), (0, 0), (1, 0)],     # I
+    [(-1, 0), (0, 0), (0, -1), (1, -1)],    # S
+    [(-1, -1), (0, -1), (0, 0), (1, 0)],    # Z
+    [(0, -2), (0, -1), (-1, 0), (0, 0)],    # J
+    [(-1, -2), (-1, -1), (-1, 0), (0, 0)],  # L
+    [(-1, 0), (0, 0), (0, -1), (1, 0)],     # T
+]
+
+# タイプごとの回転のバリエーション数
+ROTATIONS = [1, 2, 2, 2, 4, 4, 4]
+
+# 回転済みテトリミノの形
+# cells: ブロック4つの相対座標
+# min_x, max_x, min_y, max_y: 相対座標での外接矩形
+# bottom: 列(min_x から max_x)ごとの最も下のブロックの相対y座標
+# row_masks: 行(相対y)ごとの (相対y, ビットマスク) ※ビットマスクは min_x を bit 0 とする
+MinoShape = namedtuple('MinoShape', ['cells', 'min_x', 'max_x', 'min_y', 'max_y', 'bottom', 'row_masks'])
+
+
+def make_shape(t, r):
+    """ タイプと回転から MinoShape を作る
+
+    :param t: テトリミノのタイプ
+    :param r: 回転
+    :return: MinoShape
+    """
+    cells = SHAPES[t]
+    for _ in range(r % 4):
+        # 時計回りに回転
+        cells = [(-y, x) for x, y in cells]
+    cells = tuple(cells)
+    xs = [x for x, _ in cells]
+    ys = [y for _, y in cells]
+    min_x, max_x = min(xs), max(xs)
+    bottom = tuple(max(y for x, y in cells if x == col) for col in range(min_x, max_x + 1))
+    row_masks = tuple((row, sum(1 << (x - min_x) for x, y in cells if y == row))
+                      for row in range(min(ys), max(ys) + 1))
+    return MinoShape(cells, min_x, max_x, min(ys), max(ys), bottom, row_masks)
+
+
+# 全タイプ x 全回転の形をimport時に1度だけ計算しておく
+MINO_TABLE = [[make_shape(t, r) for r in range(4)] for t in range(7)]
 
 
 class Tetrimino:
@@ -11,59 +59,37 @@ class Tetrimino:
     J
     L
     T
+
+    位置(x, y), 回転(r), タイプ(t) だけを持つ値オブジェクト
+    ブロックの形は MINO_TABLE から引くので Block オブジェクトは生成しない
     """
 
-    def __init__(self, x, y, r, t):
+    __slots__ = ('x', 'y', 'r', 't', 's')
+
+    def __init__(self, x, y, r, t, s=0):
         """ イニシャライザ
 
         初期位置とタイプでインスタンス化する
-        どのTetriminoもBlockクラス4つの集合（初期ブロックの配置で各々の形をつくる）
 
         :param x: 初期位置 x
         :param y: 初期位置 y
         :param r: 初期回転 r
         :param t: テトリミノのタイプ
+        :param s: スコア値(落下の高さ)
         """
         self.x = x
         self.y = y
         self.r = r
         self.t = t
-        self.s = 0
-        if t == 0:
-            # 0 (四角)の形のブロック
-            self.shape = [Block(-1, -1, t), Block(-1, 0, t), Block(0, 0, t), Block(0, -1, t)]
-        if t == 1:
-            # I の形のブロック
-            self.shape = [Block(-2, 0, t), Block(-1, 0, t), Block(0, 0, t), Block(1, 0, t)]
-        if t == 2:
-            # S の形のブロック
-            self.shape = [Block(-1, 0, t), Block(0, 0, t), Block(0, -1, t), Block(1, -1, t)]
-        if t == 3:
-            # Z の形のブロック
-            self.shape = [Block(-1, -1, t), Block(0, -1, t), Block(0, 0, t), Block(1, 0, t)]
-        if t == 4:
-            # J の形のブロック
-            self.shape = [Block(0, -2, t), Block(0, -1, t), Block(-1, 0, t), Block(0, 0, t)]
-        if t == 5:
-            # L の形のブロック
-            self.shape = [Block(-1, -2, t), Block(-1, -1, t), Block(-1, 0, t), Block(0, 0, t)]  # L
-        if t == 6:
-            # T の形のブロック
-            self.shape = [Block(-1, 0, t), Block(0, 0, t), Block(0, -1, t), Block(1, 0, t)]     # T
-
-        for _ in range(r%4):
-            for b in self.shape:
-                b.rotate()
-
-        for b in self.shape:
-            b.move(x, y)
+        self.s = s
 
     def get_blocks(self):
         """ 現在のブロック4つを返す
 
-        :return: 4つのBlockインスタンス配列
+        :return: 4つの (x, y, 色) タプル
         """
-        return self.shape
+        x, y, t = self.x, self.y, self.t
+        return tuple((x + dx, y + dy, t) for dx, dy in MINO_TABLE[t][self.r % 4].cells)
 
     def get_type(self):
         """ タイプを返す
@@ -79,14 +105,7 @@ class Tetrimino:
         :param field: 盤面
         :return: True 当たり判定あり / False なし
         """
-        for b in self.shape:
-            x, y = b.get_pos()
-            if x < 0 or x > 10:
-                return True
-            tile = field.get_tile(x, y)
-            if tile != -1:
-                return True
-        return False
+        return field.collision(MINO_TABLE[self.t][self.r % 4], self.x, self.y)
 
     def set_score(self, score):
         """ スコアをセットする
@@ -103,14 +122,13 @@ class Tetrimino:
 
     def draw(self, screen, colors):
         """ 画面にブロックを描画する
-        実際の描画処理はBlock内で行うのでここではそれを呼び出すだけ
 
         :param screen: PyGame Screen オブジェクト
         :param colors: PyGame Surface オブジェクト(色ブロックの配列)
         :return:
         """
-        for b in self.shape:
-            b.draw(screen, colors)
+        for x, y, c in self.get_blocks():
+            screen.blit(colors[c], (BLOCK_SIZE*x, BLOCK_SIZE*y, BLOCK_SIZE, BLOCK_SIZE))
 
     def clone(self, dx=0, dy=0, dr=0):
         """ 指定の移動を行った後のクローンを生成する
@@ -120,4 +138,4 @@ class Tetrimino:
         :param dr: r回転値
         :return: インスタンスから指定の移動回転を行った後のTetriminoオブジェクト
         """
-        return Tetrimino(self.x+dx, self.y+dy, self.r+dr, self.t)
\ No newline at end of file
+        return Tetrimino(self.x+dx, self.y+dy, self.r+dr, self.t)
@@ -0,0 +1,78 @@
+import torch
+import torch.nn as nn
+from profiler import timed
+from config import input_size, output_size, weights_init_max, weights_init_min, device
+
+
+class TorchNetwork(nn.Module):
+    """ PyTouchのモデル (config.model_backend = 'torch' の場合に使う)
+
+    単純な1層の線形関数のネットワーク
+    Input=9, Output=1 (InputはField.get_field_scoreで得られた盤面評価値(9次のNumpy.Array)
+    """
+    def __init__(self, weights=None):
+        """ イニシャライザ
+
+        :param weights: 9次元のウエイト(Numpy.Array). 省略時は一様分布で初期化する
+        """
+        super(TorchNetwork, self).__init__()
+        # 線形関数１層のみ
+        self.output = nn.Linear(
+            input_size, output_size, bias=False).to(device)
+        # 今回は逆伝搬は必要ない
+        self.output.weight.requires_grad_(False)
+        # ウエイトを,一様分布で初期化
+        nn.init.uniform_(self.output.weight,
+                         a=weights_init_min, b=weights_init_max)
+        if weights is not None:
+            self.set_weights(weights)
+
+    def get_weights(self):
+        """ ウエイトを返す
+
+        :return: 9次元ベクトル(Numpy.Array float32)
+        """
+        return self.output.weight.data[0].numpy().copy()
+
+    def set_weights(self, weights):
+        """ ウエイトをセットする
+
+        :param weights: 9次元ベクトル(Numpy.Array)
+        :return:
+        """
+        self.output.weight.data[0] = torch.from_numpy(weights).float()
+
+    @timed('TorchNetwork.activate')
+    def activate(self, x):
+        """ 与えられたベクトルでモデル評価値を返す
+
+        :param x: 9次元ベクトル(Numpy.Array)
+        :return: 1次元ベクトル(評価結果)
+        """
+        with torch.no_grad():
+            x = torch.from_numpy(x).float().to(device)
+            x = self.output(x)
+        return x
+
+    @timed('TorchNetwork.activate_batch')
+    def activate_batch(self, xs):
+        """ 複数のベクトルをまとめてモデル評価する
+
+        :param xs: (候補数 x 9)の行列(Numpy.Array)
+        :return: 候補ごとの評価値 (1次元ベクトル)
+        """
+        with torch.no_grad():
+            x = torch.from_numpy(xs).float().to(device)
+            x = self.output(x)
+        return x[:, 0]
+
+    @timed('TorchNetwork.select')
+    def select(self, xs):
+        """ 複数のベクトルを1回でモデル評価し、評価値が最も高いものを選ぶ
+
+        :param xs: (候補数 x 9)の行列(Numpy.Array)
+        :return: (最も評価値が高い行のインデックス, その評価値)
+        """
+        scores = self.activate_batch(xs)
+        best = int(torch.argmax(scores))
+        return best, scores[best]
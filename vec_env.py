@@ -0,0 +1,203 @@
+import numpy as np
+from piece_source import PieceSource
+from jitfield import jit, find_placements, field_score, EMPTY_ROW, FULL_ROW, MAX_PLACEMENTS, SHAPE_CELLS
+from tetrimino import ROTATIONS
+from config import input_size, max_pieces
+
+ROTATION_COUNTS = np.array(ROTATIONS, dtype=np.int64)
+ROW_BITS = 1 << np.arange(1, 11, dtype=np.int64)    # 盤面の各列の行ビットマスクでのビット (壁が bit 0)
+
+
+@jit
+def find_all_placements(rows, types, done, out, counts):
+    """ 全盤面の初期位置のテトリミノの落下候補を求める
+
+    :param rows: 盤面ごとの各行のビットマスク (盤面数 x 21)
+    :param types: 盤面ごとのテトリミノのタイプ
+    :param done: 盤面ごとのゲームオーバーの有無 (ゲームオーバーの盤面は候補なし)
+    :param out: 結果を書き込む (盤面数 x MAX_PLACEMENTS x 4) の配列 (x, 落下後の y, 回転, 落下量)
+    :param counts: 盤面ごとの候補数を書き込む配列
+    :return:
+    """
+    for i in range(rows.shape[0]):
+        if done[i]:
+            counts[i] = 0
+        else:
+            counts[i] = find_placements(rows[i], types[i], 5, 2, 0, ROTATION_COUNTS[types[i]], out[i])
+
+
+@jit
+def all_placement_features(rows, types, placements, counts, out):
+    """ 全盤面の全ての落下候補について、置いた場合の盤面評価値を求める
+
+    :param rows: 盤面ごとの各行のビットマスク (盤面数 x 21)
+    :param types: 盤面ごとのテトリミノのタイプ
+    :param placements: find_all_placements の落下候補
+    :param counts: find_all_placements の候補数
+    :param out: 結果を書き込む (盤面数 x MAX_PLACEMENTS x 9) の配列
+    :return:
+    """
+    blocks = np.zeros((4, 3), dtype=np.int64)
+    for i in range(rows.shape[0]):
+        t = types[i]
+        for j in range(counts[i]):
+            r = placements[i, j, 2] % 4
+            for k in range(4):
+                blocks[k, 0] = placements[i, j, 0] + SHAPE_CELLS[t, r, k, 0]
+                blocks[k, 1] = placements[i, j, 1] + SHAPE_CELLS[t, r, k, 1]
+                blocks[k, 2] = t
+            out[i, j, :] = field_score(rows[i], blocks)
+
+
+class VecTetrisEnv:
+    """ 複数の盤面のゲームをまとめて1手づつ進める環境
+
+    盤面は (盤面数 x 20 x 10) の1つの配列 boards (1 = 埋まっている, 0 = 空き. 壁・床は含めない) で保持し、
+    落下候補・盤面評価値・テトリミノの配置・行の消去を全盤面まとめて計算する
+    落下候補と盤面評価値は jitfield のコンパイル済み関数を使う (numba が無い環境では同じ関数を Python で実行する)
+
+    使い方 (evaluate_population と同じ手順):
+        placements, counts = env.legal_placements()
+        values = モデル評価値 (env.features(placements, counts) から計算し、counts 以降の候補は -inf にする)
+        rewards, lines, done = env.step(placements[np.arange(env.n_envs), values.argmax(axis=1)])
+
+    ゲームオーバーになった盤面は reset されるまで候補なしのまま何もしない
+    """
+
+    def __init__(self, n_envs, seeds=None, max_pieces=max_pieces):
+        """ イニシャライザ (全盤面を reset する)
+
+        :param n_envs: 盤面数
+        :param seeds: 盤面ごとのテトリミノ列の乱数シード (None = 再現性なし)
+        :param max_pieces: 1ゲームあたりのテトリミノ数の上限 (None = ゲームオーバーまで)
+        """
+        self.n_envs = n_envs
+        self.max_pieces = max_pieces
+        self.boards = np.zeros((n_envs, 20, 10), dtype=np.uint8)
+        self.types = np.zeros(n_envs, dtype=np.int64)       # 盤面ごとの落下させるテトリミノのタイプ
+        self.done = np.ones(n_envs, dtype=bool)             # 盤面ごとのゲームオーバーの有無
+        self.scores = np.zeros(n_envs, dtype=np.int64)      # 盤面ごとの累計スコア
+        self.lines = np.zeros(n_envs, dtype=np.int64)       # 盤面ごとの累計消去ライン数
+        self.sources = [None] * n_envs
+        self.reset(seeds)
+
+    def reset(self, seeds=None, indices=None):
+        """ 盤面を空にしてゲームを最初から始める
+
+        :param seeds: 盤面ごとの乱数シード (indices と同じ長さ. None = 再現性なし)
+        :param indices: reset する盤面の番号の配列 (None = 全盤面)
+        :return: boards
+        """
+        if indices is None:
+            indices = np.arange(self.n_envs)
+        indices = np.asarray(indices, dtype=np.int64)
+        if seeds is None:
+            seeds = [None] * len(indices)
+        self.boards[indices] = 0
+        self.scores[indices] = 0
+        self.lines[indices] = 0
+        self.done[indices] = False
+        for i, seed in zip(indices.tolist(), seeds):
+            self.sources[i] = PieceSource(seed)
+            self.types[i] = self.sources[i].next_type()
+        return self.boards
+
+    def get_rows(self):
+        """ 盤面を jitfield の関数で使う行のビットマスクに変換する
+
+        :return: (盤面数 x 21) の配列 (JitField.rows と同じ. 最後の行は床)
+        """
+        rows = np.empty((self.n_envs, 21), dtype=np.int64)
+        rows[:, :20] = (self.boards.astype(np.int64) @ ROW_BITS) | EMPTY_ROW
+        rows[:, 20] = FULL_ROW
+        return rows
+
+    def legal_placements(self):
+        """ 全盤面の落下可能なテトリミノの位置を返す (search.get_candidate_list と同じ順番)
+
+        :return: (落下候補 (盤面数 x MAX_PLACEMENTS x 4) の配列 (x, 落下後の y, 回転, 落下量), 盤面ごとの候補数)
+        """
+        placements = np.zeros((self.n_envs, MAX_PLACEMENTS, 4), dtype=np.int64)
+        counts = np.zeros(self.n_envs, dtype=np.int64)
+        find_all_placements(self.get_rows(), self.types, self.done, placements, counts)
+        return placements, counts
+
+    def features(self, placements, counts):
+        """ 全盤面の落下候補について、置いた場合の盤面評価値を返す (Field.get_field_score と同じ値)
+
+        :param placements: legal_placements の落下候補
+        :param counts: legal_placements の候補数
+        :return: (盤面数 x MAX_PLACEMENTS x 9) の配列 (float32. 候補数以降は 0)
+        """
+        out = np.zeros((self.n_envs, MAX_PLACEMENTS, input_size), dtype=np.float32)
+        all_placement_features(self.get_rows(), self.types, placements, counts, out)
+        return out
+
+    def step(self, placements):
+        """ 盤面ごとに選んだ位置にテトリミノを置き、埋まった行を消して次のテトリミノを出す
+
+        次のテトリミノが初期位置に置けない盤面(またはテトリミノ数が上限に達した盤面)はゲームオーバーになる
+        ゲームオーバーの盤面の placements は無視する
+
+        :param placements: 盤面ごとに legal_placements の候補から選んだ位置 (盤面数 x 4)
+        :return: (盤面ごとのスコア(落下量), 消去ライン数, ゲームオーバーの有無) の配列
+        """
+        placements = np.asarray(placements, dtype=np.int64)
+        live = np.flatnonzero(~self.done)
+        rewards = np.zeros(self.n_envs, dtype=np.int64)
+        lines = np.zeros(self.n_envs, dtype=np.int64)
+        if len(live) == 0:
+            return rewards, lines, self.done.copy()
+
+        # テトリミノの4つのブロックを置く (盤面の x は壁を除くので -1)
+        x, y, r, drop = placements[live].T
+        cells = SHAPE_CELLS[self.types[live], r % 4]
+        self.boards[live[:, np.newaxis], y[:, np.newaxis] + cells[:, :, 1], x[:, np.newaxis] + cells[:, :, 0] - 1] = 1
+
+        # 埋まった行を上に集めて空にする (埋まっていない行の順番は変えない)
+        boards = self.boards[live]
+        full = boards.all(axis=2)
+        erased = full.sum(axis=1)
+        order = np.argsort(~full, axis=1, kind='stable')
+        boards = np.take_along_axis(boards, order[:, :, np.newaxis], axis=1)
+        boards[np.arange(20) < erased[:, np.newaxis]] = 0
+        self.boards[live] = boards
+
+        rewards[live] = drop
+        lines[live] = erased
+        self.scores += rewards
+        self.lines += lines
+
+        # 次のテトリミノを出す
+        for i in live.tolist():
+            self.types[i] = self.sources[i].next_type()
+            if self.max_pieces is not None and self.sources[i].count > self.max_pieces:
+                self.done[i] = True
+        cells = SHAPE_CELLS[self.types[live], 0]
+        spawn = self.boards[live[:, np.newaxis], 2 + cells[:, :, 1], 5 + cells[:, :, 0] - 1]
+        self.done[live] |= spawn.any(axis=1)
+        return rewards, lines, self.done.copy()
+
+
+if __name__ == "__main__":
+    from evaluator import evaluate_population
+    from network import score_features
+
+    # 同じウエイト・シードで evaluate_population と同じ結果 (累計スコアの合計, 手数) になるか確認する
+    rng = np.random.default_rng(0)
+    weights = rng.uniform(-1, 1, (20, input_size)).astype(np.float32)
+    seeds = [0, 1, 2]
+    expected = evaluate_population(weights, seeds, max_pieces=300, per_game=True)
+
+    owners = np.repeat(np.arange(len(weights)), len(seeds))
+    env = VecTetrisEnv(len(owners), [seeds[i % len(seeds)] for i in range(len(owners))], max_pieces=300)
+    result = np.zeros((len(owners), 2))
+    while not env.done.all():
+        live = ~env.done
+        placements, counts = env.legal_placements()
+        values = score_features(env.features(placements, counts), weights[owners][:, np.newaxis, :])
+        values[np.arange(MAX_PLACEMENTS) >= counts[:, np.newaxis]] = -np.inf
+        env.step(placements[np.arange(env.n_envs), values.argmax(axis=1)])
+        result[live] += np.stack([env.scores[live], np.ones(live.sum())], axis=1)
+    assert np.array_equal(result.reshape(expected.shape), expected)
+    print("ok")